@@ -2,16 +2,24 @@ import os
 import time
 import sys
 import asyncio
-import numpy as np
-import re
 import logging
 from dotenv import load_dotenv
 
-from src.lib.sound import Audio
-from src.lib.speech_recognition import SpeechRecognizer
+# Vosk, Piper, numpy, sounddevice and aiohttp are imported on the loader
+# threads in Assistant.load(), only rich is needed for the welcome screen
 from src.lib.chatgpt import ChatGPT
-from src.lib.tts import TTS
 from src.lib.screen import Screen
+from src.lib.commands import (
+    QUIT_PHRASES,
+    SIMILARITY_THRESHOLD,
+    SLEEP_GRAMMAR,
+    WAKE_PHRASES,
+)
+from src.lib.matcher import CommandMatcher
+from src.lib.segmenter import Segmenter
+from src.lib.startup import Startup
+from src.lib.speculation import Speculator
+from src.lib.tracing import tracer
 
 sys.stderr = open(os.devnull, "w")
 logging.basicConfig(level=logging.ERROR)
@@ -25,12 +33,16 @@ WELCOME_MESSAGES = [
 
 
 async def shutdown(assistant):
+    from src.lib.sound import Audio
+
     await asyncio.to_thread(Audio.play_sound_file, "quit")
     if assistant:
         await assistant.quit()
 
 
 def convert_24bit_wav_to_float32(audio_data):
+    import numpy as np
+
     audio_bytes = np.frombuffer(audio_data, dtype=np.uint8)
     audio_int32 = np.zeros(len(audio_bytes) // 3, dtype=np.int32)
     audio_int32 += (
@@ -48,89 +60,185 @@ def convert_24bit_wav_to_float32(audio_data):
 
 
 class Assistant:
-    _QUIT_PHRASES = ["stop", "quit", "exit", "shut down"]
-    _WAKE_PHRASES = ["hey gpt", "ok gpt", "chatgpt", "okay gpt"]
-    _SIMILARITY_THRESHOLD = 0.7
-
-    @staticmethod
-    def jaccard_similarity(str1, str2):
-        set1 = set(str1)
-        set2 = set(str2)
-        return len(set1.intersection(set2)) / len(set1.union(set2))
-
-    def __init__(self):
+    def __init__(self, audio_source=None, console=None):
         self._awake = False
+        # Headless runs pass a WavFileSource and a file-backed rich Console
+        self._audio_source = audio_source
+        self._console = console
+        self.commands = CommandMatcher(SIMILARITY_THRESHOLD)
+        self.commands.add("quit", QUIT_PHRASES)
+        self.commands.add("wake", WAKE_PHRASES)
         api_key = os.environ.get("OPENAI_API_KEY")
         self._api_key = api_key
-        self.chat_gpt = ChatGPT({"api_key": self._api_key})
-        self.tts = TTS()
-        self.screen = Screen()
-        self.speech_recognizer = SpeechRecognizer()
+        self.chat_gpt = ChatGPT(
+            {
+                "api_key": self._api_key,
+                "api_base": os.environ.get("OPENAI_API_BASE"),
+            }
+        )
+        self.screen = None
+        self.tts = None
+        self.speech_recognizer = None
+        self.startup = Startup()
         self._last_speech_timestamp = None
-        self.current_conversation = []
+        self._barge_in = os.environ.get("BARGE_IN", "1") != "0"
+        self._response = None
+        self._spoken = []
+        # Opt in: start completions once a partial transcript holds still
+        speculate_ms = os.environ.get("SPECULATE_MS")
+        self._speculate_ms = int(speculate_ms) if speculate_ms else None
+        self._speculator = Speculator(self.chat_gpt) if self._speculate_ms else None
+
+    def _load_speech_recognizer(self):
+        from src.lib.speech_recognition import SpeechRecognizer
+
+        endpoint_ms = os.environ.get("ASR_ENDPOINT_MS")
+        blocksize = os.environ.get("ASR_BLOCKSIZE")
+        return SpeechRecognizer(
+            blocksize=int(blocksize) if blocksize else None,
+            endpoint_ms=int(endpoint_ms) if endpoint_ms else None,
+            wake_phrases=SLEEP_GRAMMAR,
+            source=self._audio_source,
+        )
+
+    @staticmethod
+    def _load_earcons():
+        from src.lib.sound import Audio
+
+        Audio.preload()
+
+    def _load_tts(self):
+        from src.lib.tts import TTS
+
+        processes = os.environ.get("TTS_PROCESSES")
+        return TTS(
+            cache_dir=os.environ.get("TTS_CACHE_DIR"),
+            processes=int(processes) if processes else 0,
+        )
 
-    async def resume(self):
+    async def load(self):
+        """Shows the welcome screen, then loads both models side by side"""
+        metrics_port = os.environ.get("METRICS_PORT")
+        tracer.configure(
+            trace_file=os.environ.get("TRACE_FILE"),
+            metrics_port=int(metrics_port) if metrics_port else None,
+        )
+        with self.startup.phase("screen"):
+            self.screen = Screen(console=self._console)
+            self.screen.set(WELCOME_MESSAGES, animate=False)
+        await self.startup.run("earcons", self._load_earcons)
+        from src.lib.sound import Audio
+
+        startup_sound = asyncio.create_task(
+            asyncio.to_thread(Audio.play_sound_file, "startup")
+        )
+        self.speech_recognizer, self.tts, _ = await asyncio.gather(
+            self.startup.run("speech_recognizer", self._load_speech_recognizer),
+            self.startup.run("tts", self._load_tts),
+            self.startup.run("http", ChatGPT.preload),
+        )
+        self._barge_in = self._barge_in and self.speech_recognizer.can_barge_in
+        self.speech_recognizer.on_speech_start(self.handle_barge_in)
+        if self._speculator:
+            self.speech_recognizer.on_stable_partial(
+                self.handle_stable_partial, self._speculate_ms
+            )
+        await startup_sound
+        self.startup.mark("ready")
+        logging.debug(f"startup: {self.startup.report()}")
+        report_path = os.environ.get("STARTUP_REPORT")
+        if report_path:
+            self.startup.write_report(report_path)
+
+    async def resume(self, sound=True):
+        from src.lib.sound import Audio
+
+        self.speech_recognizer.guard_echo(False)
         self.speech_recognizer.resume()
         self._last_speech_timestamp = round(time.time(), 2)
-        await asyncio.to_thread(Audio.play_sound_file, "awake")
+        if sound:
+            await asyncio.to_thread(Audio.play_sound_file, "awake")
+
+    def _speak(self, text, start, end):
+        loop = asyncio.get_running_loop()
+
+        def on_start():
+            # Highlight the streamed text while its audio is playing
+            self._spoken.append(text)
+            self.screen.highlight(start, end)
+
+        self.tts.speak(text, on_start=lambda: loop.call_soon_threadsafe(on_start))
+
+    def handle_barge_in(self):
+        if self._response is None or self._response.done():
+            return
+        logging.debug("barge-in: interrupting response")
+        self.tts.cancel()
+        # Closes the completion stream so no more tokens are generated
+        self._response.cancel()
+
+    def handle_stable_partial(self, text):
+        if not self._awake or (self._response and not self._response.done()):
+            return
+        if not text or self.commands.match(text):
+            return
+        logging.debug(f"speculating on: {text}")
+        self._speculator.start(text)
+
+    async def _respond(self, text):
+        full_response = []
+        segmenter = Segmenter()
+        self.screen.stream("## Thinking...")
+        offset = 0
+        streaming = False
+        stream = self._speculator.take(text) if self._speculator else None
+        if stream is None:
+            stream = self.chat_gpt.chat(text, commit=False)
+        async for chunk in stream:
+            if not streaming:
+                self.screen.stream("## GPT:")
+                streaming = True
+            self.screen.append(chunk)
+            for segment in segmenter.feed(chunk):
+                logging.debug(f"playing segment: {segment}")
+                full_response.append(segment)
+                self._speak(segment, offset, offset + len(segment))
+                offset += len(segment)
+
+        for segment in segmenter.flush():
+            logging.debug(f"playing final segment: {segment}")
+            full_response.append(segment)
+            self._speak(segment, offset, offset + len(segment))
+            offset += len(segment)
+
+        await asyncio.to_thread(self.tts.wait)
+        logging.debug(f"full response: {full_response}")
+        return "".join(full_response)
 
     async def chat(self, text):
+        tracer.new_turn()
+        turn_started = time.monotonic()
         try:
             await self.screen.write([f'### "{text}"'])
             self._last_speech_timestamp = None
-            self.speech_recognizer.pause()
-            full_response = []
-            chunks = []
-            asyncio.create_task(self.screen.write(["## Thinking..."]))
-            wrote = 0
-            async for chunk in self.chat_gpt.chat(text):
-                chunks.append(chunk)
-                wrote += 1
-                if (
-                    len(chunks) > 10
-                    and not re.match(r"\d+[.,]$", chunk.strip())
-                    and not re.match(r"\d+[.,]$", chunks[-1].strip())
-                ):
-                    for terminator in [",", ".", "?", "!", ";", "and", "or"]:
-                        if chunk.strip().endswith(terminator):
-                            joined = "".join(chunks)
-                            logging.debug(f"playing segment: {joined}")
-                            full_response.append(joined)
-                            await asyncio.to_thread(self.tts.text_to_speech, joined)
-                            chunks = []
-
-            if len(chunks) > 0:
-                joined = "".join(chunks)
-                logging.debug(f"playing final segment: {joined}")
-                full_response.append(joined)
-                await asyncio.to_thread(self.tts.text_to_speech, joined)
-                chunks = []
-
-            print(f"full response: {full_response}")
-
-            asyncio.create_task(
-                self.screen.write(
-                    [
-                        "## GPT:",
-                        "\n### " + "\n".join(full_response).replace("\n", "\n### "),
-                    ]
-                )
-            )
-
-            self.current_conversation.append(
-                {
-                    "role": "user",
-                    "content": text,
-                }
-            )
+            if self._barge_in:
+                self.speech_recognizer.guard_echo(True)
+            else:
+                self.speech_recognizer.pause()
+            self._spoken = []
+            self._response = asyncio.create_task(self._respond(text))
+            await asyncio.wait({self._response})
+            self.screen.highlight(None)
 
-            self.current_conversation.append(
-                {
-                    "role": "assistant",
-                    "content": " ".join(full_response),
-                }
-            )
+            if self._response.cancelled():
+                # Only what the user actually heard goes into the history
+                self.chat_gpt.commit(text, "".join(self._spoken).strip())
+                tracer.record("turn", turn_started, interrupted=True)
+                await self.resume(sound=False)
+                return
 
+            self.chat_gpt.commit(text, self._response.result().strip())
+            tracer.record("turn", turn_started)
             await self.resume()
 
         except Exception as e:
@@ -139,50 +247,53 @@ class Assistant:
             return
 
     async def sleep(self):
+        from src.lib.sound import Audio
+
+        self._drop_speculation()
+        self.speech_recognizer.use_wake_grammar()
         await asyncio.to_thread(Audio.play_sound_file, "sleep")
         self._awake = False
         self._last_speech_timestamp = None
         await self.screen.write(WELCOME_MESSAGES)
 
     async def awaken(self):
+        from src.lib.sound import Audio
+
+        self.speech_recognizer.use_full_vocabulary()
+        asyncio.create_task(self.chat_gpt.prewarm())
         await asyncio.to_thread(Audio.play_sound_file, "awake")
         self._awake = True
         self._last_speech_timestamp = round(time.time(), 2)
         await self.screen.write(["### Speak now..."])
 
+    def _drop_speculation(self):
+        # Called for final transcripts that won't be answered, so the
+        # request started on their partial doesn't outlive them
+        if self._speculator:
+            self._speculator.cancel()
+
     async def handle_awake(self, text):
         logging.debug(f"awake text: {text}")
-        for quit_phrase in self._QUIT_PHRASES:
-            if (
-                Assistant.jaccard_similarity(quit_phrase, text)
-                > self._SIMILARITY_THRESHOLD
-            ):
-                await self.sleep()
-                self.current_conversation = []
-                self.chat_gpt.reset()
-                return
+        match = self.commands.match(text)
+        if match and match.command == "quit":
+            # sleep() drops the speculation
+            await self.sleep()
+            self.chat_gpt.reset()
+            return
         await self.chat(text)
 
     async def handle_asleep(self, text):
-        for quit_phrase in self._QUIT_PHRASES:
-            if (
-                Assistant.jaccard_similarity(quit_phrase, text)
-                > self._SIMILARITY_THRESHOLD
-            ):
-                await self.quit()
-                return
-        for wake_phrase in self._WAKE_PHRASES:
-            if (
-                Assistant.jaccard_similarity(wake_phrase, text)
-                > self._SIMILARITY_THRESHOLD
-            ):
-                await self.awaken()
-                return
+        self._drop_speculation()
+        match = self.commands.match(text)
+        if not match:
+            return
+        if match.command == "quit":
+            await self.quit()
+        elif match.command == "wake":
+            await self.awaken()
 
     async def handle_speech(self, text):
-        # Weird bug where the asr returns "huh" for various air sounds
-        if text == "huh":
-            return
+        # "huh" and other noise never gets here, GatedDecoder drops it
         self._last_speech_timestamp = round(time.time(), 2)
         if self._awake:
             await self.handle_awake(text)
@@ -214,6 +325,12 @@ class Assistant:
             return
 
     async def quit(self):
+        from src.lib.output import AudioOutput
+
+        if self._speculator:
+            logging.debug(f"speculation: {self._speculator.stats()}")
+            self._speculator.cancel()
+        await self.chat_gpt.close()
         for task in asyncio.all_tasks():
             logging.debug(f"task: {task}")
             task.cancel()
@@ -221,15 +338,22 @@ class Assistant:
                 await task
             except asyncio.CancelledError:
                 pass
-        self.speech_recognizer.kill()
-        self.screen.quit()
+        if self.speech_recognizer:
+            logging.debug(f"asr: {self.speech_recognizer.stats()}")
+            self.speech_recognizer.kill()
+        if self.tts:
+            logging.debug(f"synthesis cache: {self.tts.cache.stats()}")
+            self.tts.close()
+        AudioOutput.close_shared()
+        tracer.close()
+        if self.screen:
+            self.screen.quit()
         sys.exit()
 
     async def start(self):
         logging.debug("Starting assistant...\n")
         try:
-            await self.screen.write(WELCOME_MESSAGES)
-            await asyncio.to_thread(Audio.play_sound_file, "startup")
+            await self.load()
             await asyncio.gather(
                 self.check_awake_status(),
                 self.speech_recognizer.start([self.handle_speech]),
@@ -0,0 +1,233 @@
+"""Drives the whole assistant through scripted sessions without any hardware.
+
+Microphone input comes from WAV files through WavFileSource, audio goes to
+a CaptureSink, the screen renders into a string and completions come from
+the local stub server in benchmarks.stub_sse. Each session says the wake
+phrase, asks each question in turn and goes back to sleep. Reports:
+
+    wake                   end of the wake phrase -> awaken()
+    speech_to_first_token  end of the question -> first completion token
+    first_token_to_audio   first token -> first reply audio reaching the sink
+    turn                   end of the question -> listening again
+
+    python -m benchmarks.e2e wake.wav question1.wav [question2.wav ...] \\
+        [--sessions 5] [--first-token-ms 300] [--token-ms 30] [--json out.json]
+
+Fixtures are 16-bit mono WAVs; give each one a second or so of trailing
+room noise so endpointing has something to trigger on. Replies are served
+round-robin, so with fewer replies than turns later turns hit the
+synthesis cache. Needs the Vosk and Piper models."""
+
+import argparse
+import asyncio
+import importlib.util
+import io
+import json
+import math
+import os
+import time
+
+from rich.console import Console
+
+from benchmarks.stub_sse import StubServer, read_replies
+from src.lib.headless import CaptureSink, WavFileSource
+from src.lib.output import AudioOutput
+from src.lib.speech_recognition import Endpointer
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS = ["wake", "speech_to_first_token", "first_token_to_audio", "turn"]
+
+
+def load_assistant_class():
+    spec = importlib.util.spec_from_file_location(
+        "assistant_main", os.path.join(_ROOT, "__main__.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Assistant
+
+
+def trailing_seconds(pcm, sample_rate, silence_rms=300, block_ms=20):
+    """Audio time after the last block louder than the silence threshold"""
+    size = sample_rate * block_ms // 1000 * 2
+    last = 0
+    for offset in range(0, len(pcm), size):
+        block = pcm[offset : offset + size]
+        if Endpointer.rms(block) >= silence_rms:
+            last = offset + len(block)
+    return (len(pcm) - last) / 2 / sample_rate
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def timed(Assistant):
+    class TimedAssistant(Assistant):
+        """Assistant that posts (event, monotonic time) pairs to self.events"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.events = asyncio.Queue()
+            chat = self.chat_gpt.chat
+
+            async def timed_chat(*args, **kwargs):
+                first = True
+                async for chunk in chat(*args, **kwargs):
+                    if first:
+                        self._event("first_token")
+                        first = False
+                    yield chunk
+
+            self.chat_gpt.chat = timed_chat
+
+        def _event(self, name):
+            self.events.put_nowait((name, time.monotonic()))
+
+        async def awaken(self):
+            self._event("awake")
+            await super().awaken()
+            self._event("listening")
+
+        async def resume(self, sound=True):
+            await super().resume(sound)
+            self._event("resumed")
+
+    return TimedAssistant
+
+
+async def next_event(assistant, name, timeout):
+    while True:
+        event, at = await asyncio.wait_for(assistant.events.get(), timeout)
+        if event == name:
+            return at
+
+
+async def utterance(source, pcm):
+    """Plays pcm into the recognizer, returns the time its speech ended"""
+    done_at = await asyncio.wrap_future(source.play(pcm))
+    return done_at - trailing_seconds(pcm, source.samplerate)
+
+
+async def run_sessions(assistant, source, sink, wake, questions, sessions, timeout):
+    results = {metric: [] for metric in METRICS}
+    failures = 0
+    for session in range(sessions):
+        try:
+            speech_end = await utterance(source, wake)
+            results["wake"].append(
+                await next_event(assistant, "awake", timeout) - speech_end
+            )
+            await next_event(assistant, "listening", timeout)
+            for question in questions:
+                speech_end = await utterance(source, question)
+                first_token = await next_event(assistant, "first_token", timeout)
+                resumed = await next_event(assistant, "resumed", timeout)
+                first_audio = next(t for t in sink.onsets if t >= first_token)
+                results["speech_to_first_token"].append(first_token - speech_end)
+                results["first_token_to_audio"].append(first_audio - first_token)
+                results["turn"].append(resumed - speech_end)
+        except (asyncio.TimeoutError, StopIteration):
+            # Misheard or lost utterance, start the next session from scratch
+            failures += 1
+        await assistant.sleep()
+        assistant.chat_gpt.reset()
+        while not assistant.events.empty():
+            assistant.events.get_nowait()
+    return results, failures
+
+
+def report(results, failures, sessions):
+    summary = {}
+    print(f"{sessions - failures}/{sessions} sessions completed")
+    for metric in METRICS:
+        values = results[metric]
+        if not values:
+            print(f"{metric:>22}: no samples")
+            continue
+        summary[metric] = {f"p{p}": percentile(values, p) * 1000 for p in (50, 90, 99)}
+        summary[metric]["n"] = len(values)
+        row = "  ".join(
+            f"{k} {v:7.1f}ms" for k, v in summary[metric].items() if k != "n"
+        )
+        print(f"{metric:>22}: {row}  (n={len(values)})")
+    return summary
+
+
+async def bench(args):
+    server = None
+    if args.api_base:
+        os.environ["OPENAI_API_BASE"] = args.api_base
+    else:
+        replies = read_replies(args.replies) if args.replies else None
+        server = StubServer(replies, args.first_token_ms, args.token_ms)
+        os.environ["OPENAI_API_BASE"] = await server.start()
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    source = WavFileSource(samplerate=args.sample_rate)
+    wake = source.load(args.wake)
+    questions = [source.load(path) for path in args.questions]
+    sinks = []
+
+    def capture(**kwargs):
+        sinks.append(CaptureSink(**kwargs))
+        return sinks[-1]
+
+    AudioOutput.install(AudioOutput(sink=capture))
+    sink = sinks[0]
+
+    assistant = timed(load_assistant_class())(
+        audio_source=source, console=Console(file=io.StringIO(), width=100)
+    )
+    await assistant.load()
+    listener = asyncio.create_task(
+        assistant.speech_recognizer.start([assistant.handle_speech])
+    )
+    try:
+        results, failures = await run_sessions(
+            assistant, source, sink, wake, questions, args.sessions, args.timeout
+        )
+    finally:
+        listener.cancel()
+        assistant.speech_recognizer.kill()
+        assistant.tts.close()
+        AudioOutput.close_shared()
+        await assistant.chat_gpt.close()
+        assistant.screen.quit()
+        if server is not None:
+            await server.stop()
+
+    summary = report(results, failures, args.sessions)
+    summary["asr"] = assistant.speech_recognizer.stats()
+    print(f"asr: {summary['asr']}")
+    # Replies repeat once there are more turns than replies, see --replies
+    summary["synthesis_cache"] = assistant.tts.cache.stats()
+    print(f"synthesis cache: {summary['synthesis_cache']}")
+    if assistant._speculator:
+        # Set SPECULATE_MS to compare against a run without it
+        summary["speculation"] = assistant._speculator.stats()
+        print(f"speculation: {summary['speculation']}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"failures": failures, "metrics": summary}, file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("wake")
+    parser.add_argument("questions", nargs="+")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--replies", help="one stub reply per line")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=30)
+    parser.add_argument("--api-base", help="use a real endpoint instead of the stub")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Time from end of speech to a final result on recorded WAV fixtures.
+
+Each 16-bit mono WAV is fed to a KaldiRecognizer block by block as if it
+were arriving live. End of speech is the last block louder than the
+silence threshold; the reported latency is the audio time between that
+point and the block that produced the final result, plus decode time.
+
+    python -m benchmarks.endpointing speech1.wav speech2.wav ...
+
+Pad fixtures with a second or two of trailing room noise so Vosk's own
+endpointing has something to trigger on."""
+
+import argparse
+import json
+import time
+import wave
+
+from vosk import Model, KaldiRecognizer, SetLogLevel
+
+from src.lib.speech_recognition import Endpointer
+
+
+def read_wav(path):
+    with wave.open(path, "rb") as wf:
+        if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit mono audio")
+        return wf.getframerate(), wf.readframes(wf.getnframes())
+
+
+def end_of_speech(data, blocksize, silence_rms):
+    last = 0
+    for offset in range(0, len(data), blocksize * 2):
+        block = data[offset : offset + blocksize * 2]
+        if Endpointer.rms(block) >= silence_rms:
+            last = offset + len(block)
+    return last // 2
+
+
+def replay(model, sample_rate, data, blocksize, endpoint_ms, silence_rms):
+    rec = KaldiRecognizer(model, sample_rate)
+    endpointer = (
+        Endpointer(sample_rate, endpoint_ms, silence_rms) if endpoint_ms else None
+    )
+    decode = 0.0
+    for offset in range(0, len(data), blocksize * 2):
+        block = data[offset : offset + blocksize * 2]
+        started = time.perf_counter()
+        final = rec.AcceptWaveform(block)
+        if not final and endpointer:
+            partial = json.loads(rec.PartialResult()).get("partial")
+            final = endpointer.update(block, partial)
+        decode += time.perf_counter() - started
+        if final:
+            return (offset + len(block)) // 2, decode
+    return None, decode
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures", nargs="+")
+    parser.add_argument("--blocksizes", default="8000,1600,800")
+    parser.add_argument("--endpoint-ms", default="0,300")
+    parser.add_argument("--silence-rms", type=float, default=300)
+    args = parser.parse_args()
+
+    SetLogLevel(-1)
+    model = Model(lang="en-us")
+    fixtures = [read_wav(path) for path in args.fixtures]
+
+    for blocksize in map(int, args.blocksizes.split(",")):
+        for endpoint_ms in map(int, args.endpoint_ms.split(",")):
+            latencies = []
+            for sample_rate, data in fixtures:
+                speech_end = end_of_speech(data, blocksize, args.silence_rms)
+                final_at, decode = replay(
+                    model, sample_rate, data, blocksize, endpoint_ms, args.silence_rms
+                )
+                if final_at is not None:
+                    latencies.append((final_at - speech_end) / sample_rate + decode)
+            if latencies:
+                mean = sum(latencies) / len(latencies)
+                summary = (
+                    f"mean {mean * 1000:7.1f}ms, max {max(latencies) * 1000:7.1f}ms"
+                )
+            else:
+                summary = "no final results"
+            print(
+                f"blocksize {blocksize:5d}, endpoint {endpoint_ms:4d}ms: {summary} "
+                f"({len(latencies)}/{len(fixtures)} finalized)"
+            )
+
+
+if __name__ == "__main__":
+    main()
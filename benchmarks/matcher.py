@@ -0,0 +1,86 @@
+"""Speed of CommandMatcher against the old character Jaccard.
+
+    python -m benchmarks.matcher [--sizes 10,100,1000,10000]
+
+Measured as the command list grows with synthetic user-defined commands.
+Accuracy on the assistant's own phrases is covered by tests/test_matcher.py."""
+
+import argparse
+import random
+import time
+
+from src.lib.matcher import CommandMatcher
+
+# Unlabelled, for timing only: what they should match is in tests/test_matcher.py
+UTTERANCES = [
+    "stop",
+    "shutdown",
+    "okay g p t",
+    "chat gpt",
+    "what is the tallest stop sign",
+    "please tell me about post offices",
+    "pots and pans",
+    "the exit interview",
+    "what's the weather",
+    "quite",
+]
+
+
+def jaccard_similarity(str1, str2):
+    set1 = set(str1)
+    set2 = set(str2)
+    return len(set1.intersection(set2)) / len(set1.union(set2))
+
+
+def legacy_match(text, commands, threshold=0.7):
+    for command, phrases in commands:
+        for phrase in phrases:
+            if jaccard_similarity(phrase, text) > threshold:
+                return command
+    return None
+
+
+def synthetic_commands(n, rng):
+    words = [
+        "".join(
+            rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 8))
+        )
+        for _ in range(2000)
+    ]
+    return [(f"cmd{i}", [" ".join(rng.sample(words, 3))]) for i in range(n)]
+
+
+def speed(sizes, queries=200):
+    rng = random.Random(0)
+    utterances = UTTERANCES * (queries // len(UTTERANCES) + 1)
+    utterances = utterances[:queries]
+    for size in sizes:
+        commands = synthetic_commands(size, rng)
+        matcher = CommandMatcher()
+        for command, phrases in commands:
+            matcher.add(command, phrases)
+
+        started = time.perf_counter()
+        for text in utterances:
+            legacy_match(text, commands)
+        legacy = (time.perf_counter() - started) / queries
+
+        started = time.perf_counter()
+        for text in utterances:
+            matcher.match(text)
+        new = (time.perf_counter() - started) / queries
+        print(
+            f"{size:6d} commands: legacy {legacy * 1e6:9.1f}us, "
+            f"matcher {new * 1e6:7.1f}us per utterance"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    args = parser.parse_args()
+    speed([int(size) for size in args.sizes.split(",")])
+
+
+if __name__ == "__main__":
+    main()
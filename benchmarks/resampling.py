@@ -0,0 +1,53 @@
+"""CPU cost of decoding recorded input at the capture rate vs 16 kHz.
+
+    python -m benchmarks.resampling recording_48k.wav [--blocksize 4800]
+
+The recording should be 16-bit mono at the rate the microphone actually
+delivers (usually 44.1 or 48 kHz)."""
+
+import argparse
+import time
+import wave
+
+from vosk import Model, KaldiRecognizer, SetLogLevel
+
+from src.lib.speech_recognition import Resampler
+
+
+def decode(model, sample_rate, blocks, resampler=None):
+    rec = KaldiRecognizer(model, resampler.dst_rate if resampler else sample_rate)
+    started = time.process_time()
+    for block in blocks:
+        if resampler:
+            block = resampler.process(block)
+        rec.AcceptWaveform(block)
+    rec.FinalResult()
+    return time.process_time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording")
+    parser.add_argument("--blocksize", type=int, default=None)
+    args = parser.parse_args()
+
+    with wave.open(args.recording, "rb") as wf:
+        sample_rate = wf.getframerate()
+        data = wf.readframes(wf.getnframes())
+    blocksize = args.blocksize or sample_rate // 10
+    blocks = [data[i : i + blocksize * 2] for i in range(0, len(data), blocksize * 2)]
+    duration = len(data) / 2 / sample_rate
+
+    SetLogLevel(-1)
+    model = Model(lang="en-us")
+    native = decode(model, sample_rate, blocks)
+    resampled = decode(model, sample_rate, blocks, Resampler(sample_rate, 16000))
+    print(f"audio: {duration:.1f}s at {sample_rate} Hz")
+    print(
+        f"native {sample_rate:5d} Hz: {native:6.2f}s CPU ({native / duration:.3f}x RT)"
+    )
+    print(f"resampled 16000 Hz: {resampled:6.2f}s CPU ({resampled / duration:.3f}x RT)")
+
+
+if __name__ == "__main__":
+    main()
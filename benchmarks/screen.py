@@ -0,0 +1,73 @@
+"""CPU cost of rendering a long response on a file-backed console.
+
+    python -m benchmarks.screen [--chars 2000]
+
+The legacy renderer (per-character Markdown reprint) is reproduced here
+with its 10ms sleeps removed so only rendering work is measured."""
+
+import argparse
+import asyncio
+import io
+import time
+
+from rich.console import Console
+from rich.control import Control
+from rich.markdown import Markdown
+
+from src.lib.screen import Screen
+
+
+def headless_console():
+    return Console(file=io.StringIO(), width=100, height=40, force_terminal=True)
+
+
+def legacy_write(console, messages):
+    control_sequences = ["#", "**", "*", "[](", "__", "_"]
+    control = Control()
+    height = console.height
+    total = ""
+    console.clear()
+    for i, message in enumerate(messages):
+        for j, char in enumerate(message):
+            if any(message.startswith(seq, j) for seq in control_sequences):
+                total += char
+                continue
+            total += char
+            console.print(control.move_to(0, i), justify="left")
+            console.line(height // 2 - len(total.split("\n")))
+            console.print(Markdown(total, justify="left"), justify="left")
+        total += "\n"
+
+
+async def screen_write(messages, fps, cps):
+    screen = Screen(fps=fps, typing_cps=cps, console=headless_console())
+    await screen.write(messages)
+    screen.quit()
+    return screen.frames
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chars", type=int, default=2000)
+    parser.add_argument("--fps", type=int, default=20)
+    args = parser.parse_args()
+
+    words = "Here is a **long** answer with `code`, lists and _emphasis_. "
+    body = (words * (args.chars // len(words) + 1))[: args.chars]
+    messages = ["## GPT:", "### " + body]
+
+    started = time.process_time()
+    legacy_write(headless_console(), messages)
+    legacy = time.process_time() - started
+    print(f"legacy: {legacy:7.2f}s CPU, {len(body)} Markdown renders")
+
+    # Reveal at the legacy speed (100 chars/s) and instantly
+    for cps in (100, 0):
+        started = time.process_time()
+        frames = asyncio.run(screen_write(messages, args.fps, cps))
+        cpu = time.process_time() - started
+        print(f"live (cps={cps:3d}): {cpu:7.2f}s CPU, {frames} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Time-to-first-segment of the old chunk loop vs Segmenter.
+
+    python -m benchmarks.segmenter [recorded_tokens.jsonl] [--token-ms 40]
+
+A recording is one JSON string per line, the deltas of a completion in
+order. Tokens are replayed with a fixed inter-token delay and each
+segmenter reports when its first segment would reach TTS, how many
+segments it produced, and any segment cut somewhere other than punctuation."""
+
+import argparse
+import json
+import re
+
+from src.lib.segmenter import Segmenter
+
+SAMPLES = [
+    "Portland is the largest city in Oregon. It sits on the Willamette River, "
+    "and it is known for its parks, bridges and food carts.",
+    "Sure! Dr. Smith said the dose is 2.5 mg, taken twice a day. Mix 1,000 ml "
+    "of water with it. If symptoms persist, call your doctor or the clinic.",
+    "Yes.",
+    "Here are three ideas: 1. go for a walk, 2. read a book, or 3. call a "
+    "friend. Any of them will help you relax before bed.",
+]
+
+
+def tokenize(text):
+    # Roughly BPE-shaped: long words arrive in two pieces (" Or", "egon")
+    tokens = []
+    for word in re.findall(r"\s*\S+", text):
+        if len(word.strip()) >= 6:
+            tokens.extend([word[:3], word[3:]])
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def legacy_segments(tokens):
+    segments = []
+    chunks = []
+    for chunk in tokens:
+        chunks.append(chunk)
+        if (
+            len(chunks) > 10
+            and not re.match(r"\d+[.,]$", chunk.strip())
+            and not re.match(r"\d+[.,]$", chunks[-1].strip())
+        ):
+            for terminator in [",", ".", "?", "!", ";", "and", "or"]:
+                if chunk.strip().endswith(terminator):
+                    segments.append("".join(chunks))
+                    chunks = []
+                    break
+    if chunks:
+        segments.append("".join(chunks))
+    return segments
+
+
+def first_segment_token(tokens, segments):
+    """Index of the token that completed the first segment"""
+    first = segments[0]
+    text = ""
+    for i, token in enumerate(tokens):
+        text += token
+        if len(text) >= len(first):
+            return i
+    return len(tokens) - 1
+
+
+def segmenter_segments(tokens):
+    segmenter = Segmenter()
+    segments = []
+    first_at = None
+    for i, token in enumerate(tokens):
+        segments.extend(segmenter.feed(token))
+        if segments and first_at is None:
+            first_at = i
+    segments.extend(segmenter.flush())
+    return segments, len(tokens) - 1 if first_at is None else first_at
+
+
+def broken_words(segments):
+    return [s for s in segments[:-1] if s and not re.search(r"[\W]\s*$", s)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording", nargs="?")
+    parser.add_argument("--token-ms", type=float, default=40)
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording) as file:
+            streams = [[json.loads(line) for line in file if line.strip()]]
+    else:
+        streams = [tokenize(sample) for sample in SAMPLES]
+
+    totals = {"legacy": [], "segmenter": []}
+    for tokens in streams:
+        legacy = legacy_segments(tokens)
+        legacy_first = first_segment_token(tokens, legacy)
+        new, new_first = segmenter_segments(tokens)
+        totals["legacy"].append((legacy_first + 1) * args.token_ms)
+        totals["segmenter"].append((new_first + 1) * args.token_ms)
+        print(f"{len(tokens):3d} tokens")
+        print(
+            f"  legacy:    first segment at {(legacy_first + 1) * args.token_ms:6.0f}ms, "
+            f"{len(legacy)} segments, cut at a bare word: {broken_words(legacy)}"
+        )
+        print(
+            f"  segmenter: first segment at {(new_first + 1) * args.token_ms:6.0f}ms, "
+            f"{len(new)} segments, cut at a bare word: {broken_words(new)}"
+        )
+    for name, values in totals.items():
+        print(f"mean time-to-first-segment, {name}: {sum(values) / len(values):.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
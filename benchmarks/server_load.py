@@ -0,0 +1,139 @@
+"""Load generator for server mode: many simulated rooms talking at once.
+
+Each client streams a WAV fixture at real-time pace, keeps sending
+silence until the server finalizes it, then waits for the spoken reply.
+For each concurrency level it reports the time from the end of speech to
+the first reply audio and to the end of the turn, and the highest level
+whose p99 turn latency stays under the target, per server core.
+
+    python server.py   # with OPENAI_API_BASE pointing at benchmarks.stub_sse
+    python -m benchmarks.server_load question.wav [more.wav ...] \\
+        [--url ws://127.0.0.1:8766] [--sessions 1,2,4,8,16] [--turns 3] \\
+        [--target-ms 2000] [--server-cores N]"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import wave
+
+import websockets
+
+from benchmarks.e2e import percentile, trailing_seconds
+
+
+def read_wav(path):
+    with wave.open(path, "rb") as wf:
+        if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit mono audio")
+        return wf.getframerate(), wf.readframes(wf.getnframes())
+
+
+async def receive_turn(websocket, transcribed):
+    """Reads one reply, returns when its first audio arrived"""
+    first_audio = None
+    while True:
+        message = await websocket.recv()
+        if isinstance(message, bytes):
+            if first_audio is None:
+                first_audio = time.monotonic()
+            continue
+        kind = json.loads(message).get("type")
+        if kind == "transcript":
+            transcribed.set()
+        elif kind == "turn_end":
+            return first_audio
+
+
+async def client(url, fixtures, turns, chunk_ms, timeout, results):
+    sample_rate = fixtures[0][0]
+    size = sample_rate * chunk_ms // 1000 * 2
+    silence = bytes(size)
+    async with websockets.connect(url, max_size=2**22) as websocket:
+        await websocket.send(json.dumps({"type": "start", "sample_rate": sample_rate}))
+        await websocket.recv()  # ready
+        for turn in range(turns):
+            rate, pcm = fixtures[turn % len(fixtures)]
+            transcribed = asyncio.Event()
+            next_send = time.monotonic()
+            for offset in range(0, len(pcm), size):
+                await websocket.send(pcm[offset : offset + size])
+                next_send += chunk_ms / 1000
+                await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+            speech_end = time.monotonic() - trailing_seconds(pcm, rate)
+
+            async def pad():
+                # Trailing silence until the server has finalized the utterance
+                while not transcribed.is_set():
+                    await websocket.send(silence)
+                    await asyncio.sleep(chunk_ms / 1000)
+
+            padding = asyncio.create_task(pad())
+            try:
+                first_audio = await asyncio.wait_for(
+                    receive_turn(websocket, transcribed), timeout
+                )
+            except asyncio.TimeoutError:
+                results["failures"] += 1
+                continue
+            finally:
+                transcribed.set()
+                await padding
+            if first_audio is not None:
+                results["first_audio"].append(first_audio - speech_end)
+            results["turn"].append(time.monotonic() - speech_end)
+
+
+async def level(url, fixtures, sessions, args):
+    results = {"first_audio": [], "turn": [], "failures": 0}
+    clients = [
+        client(url, fixtures, args.turns, args.chunk_ms, args.timeout, results)
+        for _ in range(sessions)
+    ]
+    outcomes = await asyncio.gather(*clients, return_exceptions=True)
+    results["failures"] += sum(isinstance(o, Exception) for o in outcomes)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures", nargs="+")
+    parser.add_argument("--url", default="ws://127.0.0.1:8766")
+    parser.add_argument("--sessions", default="1,2,4,8,16")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--target-ms", type=float, default=2000)
+    parser.add_argument("--server-cores", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    fixtures = [read_wav(path) for path in args.fixtures]
+    if len({rate for rate, _ in fixtures}) > 1:
+        parser.error("fixtures must share one sample rate")
+
+    best = 0
+    for sessions in [int(n) for n in args.sessions.split(",")]:
+        results = asyncio.run(level(args.url, fixtures, sessions, args))
+        turns = results["turn"]
+        if not turns:
+            print(f"{sessions:>4} sessions: no completed turns")
+            continue
+        first = sorted(results["first_audio"]) or [float("nan")]
+        p99 = percentile(turns, 99) * 1000
+        print(
+            f"{sessions:>4} sessions: first audio p50 "
+            f"{percentile(first, 50) * 1000:7.1f}ms p99 "
+            f"{percentile(first, 99) * 1000:7.1f}ms, turn p99 {p99:7.1f}ms, "
+            f"{len(turns)} turns, {results['failures']} failed"
+        )
+        if p99 <= args.target_ms and not results["failures"]:
+            best = sessions
+    print(
+        f"{best} sessions within {args.target_ms:.0f}ms p99 turn latency, "
+        f"{best / args.server_cores:.2f} sessions per core"
+    )
+
+
+if __name__ == "__main__":
+    main()
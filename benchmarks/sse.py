@@ -0,0 +1,114 @@
+"""Replays a recorded completion stream chopped at random byte offsets.
+
+Compares the old split-on-"data: " parsing with SSEDecoder and reports
+throughput and how many tokens each one lost.
+
+    python -m benchmarks.sse [recorded_stream.txt] [--runs N] [--seed S]
+
+Without a recording a synthetic stream shaped like the OpenAI API is used."""
+
+import argparse
+import json
+import random
+import time
+
+from src.lib.sse import SSEDecoder, loads
+
+
+def synthetic_stream(n_tokens=2000):
+    words = "the quick brown fox jumps over the lazy dog , . ?".split()
+    events = []
+    for i in range(n_tokens):
+        delta = {"content": " " + words[i % len(words)]}
+        events.append({"choices": [{"delta": delta, "finish_reason": None}]})
+    events.append({"choices": [{"delta": {}, "finish_reason": "stop"}]})
+    body = b"".join(b"data: " + json.dumps(e).encode() + b"\n\n" for e in events)
+    return body + b"data: [DONE]\n\n"
+
+
+def expected_tokens(stream):
+    decoder = SSEDecoder()
+    return _tokens(decoder.feed(stream) + decoder.close())
+
+
+def _tokens(payloads):
+    tokens = []
+    for data in payloads:
+        if data == b"[DONE]":
+            break
+        delta = loads(data)["choices"][0].get("delta", {}).get("content")
+        if delta:
+            tokens.append(delta)
+    return tokens
+
+
+def chop(stream, rng, max_size=256):
+    chunks = []
+    i = 0
+    while i < len(stream):
+        size = rng.randint(1, max_size)
+        chunks.append(stream[i : i + size])
+        i += size
+    return chunks
+
+
+def legacy_parse(chunks):
+    tokens = []
+    for chunk in chunks:
+        try:
+            stringed = chunk.decode()
+        except UnicodeDecodeError:
+            continue
+        for line in stringed.split("data: ")[1:]:
+            try:
+                parsed = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            delta = parsed.get("choices", [{}])[0].get("delta", {}).get("content")
+            if delta:
+                tokens.append(delta)
+    return tokens
+
+
+def decoder_parse(chunks):
+    decoder = SSEDecoder()
+    payloads = []
+    for chunk in chunks:
+        payloads.extend(decoder.feed(chunk))
+    return _tokens(payloads + decoder.close())
+
+
+def run(name, parse, runs, stream, expected, seed):
+    rng = random.Random(seed)
+    lost = 0
+    elapsed = 0.0
+    for _ in range(runs):
+        chunks = chop(stream, rng)
+        start = time.perf_counter()
+        tokens = parse(chunks)
+        elapsed += time.perf_counter() - start
+        lost += len(expected) - len(tokens)
+    mb = len(stream) * runs / elapsed / 2**20
+    print(f"{name:>8}: {mb:8.1f} MiB/s, lost {lost}/{len(expected) * runs} tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording", nargs="?")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording, "rb") as file:
+            stream = file.read()
+    else:
+        stream = synthetic_stream()
+    expected = expected_tokens(stream)
+
+    run("legacy", legacy_parse, args.runs, stream, expected, args.seed)
+    run("decoder", decoder_parse, args.runs, stream, expected, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Streams canned replies as server-sent events with a configurable delay
+before the first token and between tokens, so the rest of the voice loop
+can be timed without the network or the API in the picture.
+
+    python -m benchmarks.stub_sse [replies.txt] [--port 8765] \\
+        [--first-token-ms 300] [--token-ms 30]
+
+replies.txt holds one reply per line, served round-robin. Point the
+assistant at it with OPENAI_API_BASE=http://127.0.0.1:8765/v1."""
+
+import argparse
+import asyncio
+import itertools
+import json
+import re
+
+from aiohttp import web
+
+DEFAULT_REPLIES = [
+    "Sure. The capital of France is Paris, which is also its largest city. "
+    "It sits on the Seine and has been the seat of government for centuries.",
+    "Water boils at one hundred degrees Celsius at sea level. At higher "
+    "altitudes the air pressure is lower, so it boils at a lower temperature.",
+]
+
+
+def tokens(text):
+    """Splits text roughly the way the API streams it: words with leading spaces"""
+    return re.findall(r"\s*\S+", text)
+
+
+def _event(delta, finish_reason=None):
+    body = {"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    return b"data: " + json.dumps(body).encode() + b"\n\n"
+
+
+class StubServer:
+    def __init__(self, replies=None, first_token_ms=300, token_ms=30) -> None:
+        self._replies = itertools.cycle(replies or DEFAULT_REPLIES)
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.requests = 0
+        self._runner = None
+        self.url = None
+
+    async def _completions(self, request):
+        await request.read()
+        self.requests += 1
+        reply = next(self._replies)
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        try:
+            await response.write(_event({"role": "assistant", "content": ""}))
+            await asyncio.sleep(self.first_token_ms / 1000)
+            for i, token in enumerate(tokens(reply)):
+                if i:
+                    await asyncio.sleep(self.token_ms / 1000)
+                await response.write(_event({"content": token}))
+            await response.write(_event({}, "stop"))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client stopped reading, e.g. a cancelled speculative request
+            pass
+        return response
+
+    async def _models(self, request):
+        return web.json_response({"data": []})
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._completions)
+        app.router.add_route("*", "/v1/models", self._models)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}/v1"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def read_replies(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+async def serve(args):
+    replies = read_replies(args.replies) if args.replies else None
+    server = StubServer(replies, args.first_token_ms, args.token_ms)
+    print(f"serving on {await server.start(args.host, args.port)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("replies", nargs="?")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=30)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Piper load time, first-synthesis latency and real-time factor per
+ONNX Runtime configuration.
+
+    python -m benchmarks.tts [--threads 0,1,2,4] [--levels none,basic,all]
+
+Real-time factor is synthesis time divided by the duration of the audio
+produced; below 1.0 the voice synthesizes faster than it plays. The model
+must already be downloaded (run the assistant once)."""
+
+import argparse
+import os
+import time
+
+from src.lib.tts import TTS, load_voice
+
+TEXT = (
+    "The quick brown fox jumps over the lazy dog. "
+    "Portland is the largest city in Oregon, and it sits on the Willamette River. "
+    "Here are three ideas: go for a walk, read a book, or call a friend."
+)
+
+
+def measure(intra, level, runs):
+    model_path = os.path.join(TTS._PATHS.AMY, "en_US-amy-medium.onnx")
+    config_path = os.path.join(TTS._PATHS.AMY, "config.json")
+
+    started = time.perf_counter()
+    voice = load_voice(
+        model_path, config_path, intra_op_threads=intra, graph_optimization=level
+    )
+    load = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in voice.synthesize_stream_raw("Hello."):
+        pass
+    first = time.perf_counter() - started
+
+    synth = 0.0
+    audio = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        for chunk in voice.synthesize_stream_raw(TEXT):
+            audio += len(chunk) // 2
+        synth += time.perf_counter() - started
+    rtf = synth / (audio / voice.config.sample_rate)
+    return load, first, rtf
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", default="0,1,2,4")
+    parser.add_argument("--levels", default="none,basic,all")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for level in args.levels.split(","):
+        for intra in map(int, args.threads.split(",")):
+            load, first, rtf = measure(intra, level, args.runs)
+            print(
+                f"{level:>8}, {intra} intra-op threads: load {load:5.2f}s, "
+                f"first synthesis {first:5.2f}s, RTF {rtf:.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Aggregate real-time factor of a long answer against TTS worker processes.
+
+The answer is cut with Segmenter as Assistant does and every segment is
+submitted at once. Reports, per worker count, the time to the first
+segment, the aggregate real-time factor (wall time over audio duration)
+and how long playback would have stalled waiting for the next segment.
+0 workers is the single-threaded in-process baseline.
+
+    python -m benchmarks.tts_workers [--workers 0,1,2,4,8] [--runs 3]
+
+The model must already be downloaded (run the assistant once)."""
+
+import argparse
+import os
+import time
+
+from src.lib.segmenter import Segmenter
+from src.lib.synthesis_workers import ProcessSynthesizer
+from src.lib.tts import TTS, load_voice
+
+ANSWER = (
+    "Sourdough starts with a starter, a mix of flour and water that wild yeast "
+    "and bacteria have colonized. Feed it equal weights of flour and water once "
+    "a day until it reliably doubles within a few hours of feeding. To make the "
+    "dough, mix the active starter with flour, water and salt, then let it rest. "
+    "Over the next few hours, stretch and fold the dough every half hour to build "
+    "strength. When it has grown by about half and feels airy, shape it into a "
+    "tight ball and let it proof overnight in the fridge. The cold slows the "
+    "yeast and lets the flavor develop. In the morning, bake it in a preheated "
+    "Dutch oven at a high temperature, first with the lid on to trap steam and "
+    "then with the lid off so the crust can brown. Let the loaf cool completely "
+    "before slicing, or the crumb will be gummy."
+)
+
+
+def segments(text):
+    segmenter = Segmenter()
+    result = []
+    for word in text.split(" "):
+        result += segmenter.feed(word + " ")
+    return result + segmenter.flush()
+
+
+def playback(ready, durations):
+    """Seconds playback spends waiting once it has started"""
+    stall = 0.0
+    clock = ready[0]
+    for at, duration in zip(ready, durations):
+        if at > clock:
+            stall += at - clock
+            clock = at
+        clock += duration
+    return stall
+
+
+def in_process(voice, texts):
+    started = time.perf_counter()
+    ready, pcm = [], []
+    for text in texts:
+        pcm.append(b"".join(voice.synthesize_stream_raw(text)))
+        ready.append(time.perf_counter() - started)
+    return ready, pcm
+
+
+def pooled(synthesizer, texts):
+    started = time.perf_counter()
+    futures = [synthesizer.submit(text) for text in texts]
+    ready, pcm = [], []
+    # In order, like the playback thread
+    for future in futures:
+        pcm.append(future.result()[0])
+        ready.append(time.perf_counter() - started)
+    return ready, pcm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="0,1,2,4,8")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    model_path = os.path.join(TTS._PATHS.AMY, "en_US-amy-medium.onnx")
+    config_path = os.path.join(TTS._PATHS.AMY, "config.json")
+    voice = load_voice(model_path, config_path)
+    rate = voice.config.sample_rate
+    texts = segments(ANSWER)
+    print(f"{len(texts)} segments, {os.cpu_count()} cores")
+
+    for workers in map(int, args.workers.split(",")):
+        synthesizer = None
+        if workers:
+            synthesizer = ProcessSynthesizer(model_path, config_path, workers=workers)
+            synthesizer.warmup()
+        first = rtf = stall = 0.0
+        for _ in range(args.runs):
+            if synthesizer:
+                ready, pcm = pooled(synthesizer, texts)
+            else:
+                ready, pcm = in_process(voice, texts)
+            durations = [len(chunk) / 2 / rate for chunk in pcm]
+            first += ready[0]
+            rtf += ready[-1] / sum(durations)
+            stall += playback(ready, durations)
+        if synthesizer:
+            synthesizer.close()
+        print(
+            f"{workers:>3} workers: first segment {first / args.runs * 1000:7.1f}ms, "
+            f"aggregate RTF {rtf / args.runs:5.3f}, "
+            f"playback stalled {stall / args.runs:5.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
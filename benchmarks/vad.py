@@ -0,0 +1,60 @@
+"""Decoder CPU on recorded idle audio with and without the VAD gate.
+
+    python -m benchmarks.vad idle_room.wav [--blocksize 1600]
+
+The recording should be 16-bit mono room tone or background noise, the
+audio the assistant listens to most of the time. It is resampled to
+16 kHz first, exactly as SpeechRecognizer does."""
+
+import argparse
+import json
+import time
+import wave
+
+from vosk import Model, KaldiRecognizer, SetLogLevel
+
+from src.lib.speech_recognition import Resampler, VoiceActivityDetector
+
+
+def run(model, blocks, vad=None):
+    rec = KaldiRecognizer(model, 16000)
+    finals = 0
+    started = time.process_time()
+    for block in blocks:
+        voiced = vad.process(block)[0] if vad else [block]
+        for data in voiced:
+            if rec.AcceptWaveform(data) and json.loads(rec.Result()).get("text"):
+                finals += 1
+    return time.process_time() - started, finals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording")
+    parser.add_argument("--blocksize", type=int, default=None)
+    args = parser.parse_args()
+
+    with wave.open(args.recording, "rb") as wf:
+        sample_rate = wf.getframerate()
+        data = wf.readframes(wf.getnframes())
+    blocksize = args.blocksize or sample_rate // 10
+    resampler = Resampler(sample_rate, 16000)
+    blocks = [
+        resampler.process(data[i : i + blocksize * 2])
+        for i in range(0, len(data), blocksize * 2)
+    ]
+    duration = len(data) / 2 / sample_rate
+
+    SetLogLevel(-1)
+    model = Model(lang="en-us")
+    for name, vad in [("ungated", None), ("vad", VoiceActivityDetector(16000))]:
+        cpu, finals = run(model, blocks, vad)
+        skipped = f", {vad.skipped_blocks}/{len(blocks)} blocks skipped" if vad else ""
+        print(
+            f"{name:>8}: {cpu:6.2f}s CPU for {duration:.1f}s of audio "
+            f"({cpu / duration:.3f}x RT), {finals} spurious results{skipped}"
+        )
+
+
+if __name__ == "__main__":
+    main()
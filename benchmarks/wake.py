@@ -0,0 +1,81 @@
+"""Full-vocabulary vs wake-grammar recognition while asleep.
+
+    python -m benchmarks.wake idle.wav wake_phrase1.wav wake_phrase2.wav ...
+
+Every recording (16-bit mono) is decoded by both recognizers. CPU time is
+summed over all of them, and detection latency is measured on the ones
+that contain a wake phrase: audio time from the last loud block to the
+block whose final result contains "g p t"/"gpt"."""
+
+import argparse
+import json
+import time
+import wave
+
+from vosk import Model, KaldiRecognizer, SetLogLevel
+
+from src.lib.commands import SLEEP_GRAMMAR
+from src.lib.speech_recognition import Endpointer, Resampler
+
+
+def load(path, blocksize):
+    with wave.open(path, "rb") as wf:
+        sample_rate = wf.getframerate()
+        data = wf.readframes(wf.getnframes())
+    resampler = Resampler(sample_rate, 16000)
+    data = resampler.process(data)
+    return [data[i : i + blocksize * 2] for i in range(0, len(data), blocksize * 2)]
+
+
+def decode(rec, blocks):
+    detected_at = None
+    speech_end = 0
+    started = time.process_time()
+    for i, block in enumerate(blocks):
+        if Endpointer.rms(block) >= 300:
+            speech_end = i + 1
+        if rec.AcceptWaveform(block):
+            text = json.loads(rec.Result()).get("text", "")
+            if detected_at is None and "gpt" in text.replace(" ", ""):
+                detected_at = i + 1
+    rec.FinalResult()
+    cpu = time.process_time() - started
+    latency = None if detected_at is None else detected_at - speech_end
+    return cpu, latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recordings", nargs="+")
+    parser.add_argument("--blocksize", type=int, default=1600)
+    args = parser.parse_args()
+
+    SetLogLevel(-1)
+    model = Model(lang="en-us")
+    recordings = [load(path, args.blocksize) for path in args.recordings]
+    block_seconds = args.blocksize / 16000
+
+    for name, grammar in [
+        ("full", None),
+        ("grammar", json.dumps(SLEEP_GRAMMAR + ["[unk]"])),
+    ]:
+        cpu_total = 0.0
+        latencies = []
+        for blocks in recordings:
+            if grammar:
+                rec = KaldiRecognizer(model, 16000, grammar)
+            else:
+                rec = KaldiRecognizer(model, 16000)
+            cpu, latency = decode(rec, blocks)
+            cpu_total += cpu
+            if latency is not None:
+                latencies.append(latency * block_seconds)
+        detected = f"{len(latencies)}/{len(recordings)} detected"
+        if latencies:
+            mean = sum(latencies) / len(latencies)
+            detected += f", mean latency {mean * 1000:.0f}ms"
+        print(f"{name:>8}: {cpu_total:6.2f}s CPU, {detected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+from vosk import Model, SetLogLevel
+
+from src.lib.server import AssistantServer
+from src.lib.synthesis_cache import SynthesisCache
+from src.lib.synthesis_pool import SynthesisPool
+from src.lib.tracing import tracer
+from src.lib.tts import TTS, load_voice
+from src.lib.assets import AssetManager
+
+logging.basicConfig(level=logging.ERROR)
+load_dotenv()
+
+
+def load_pool():
+    AssetManager().ensure(TTS._assets())
+    model_path, config_path = [asset.path for asset in TTS._assets()]
+    workers = int(os.environ.get("TTS_WORKERS") or os.cpu_count())
+    # One intra-op thread each: the workers provide the parallelism
+    voice = load_voice(model_path, config_path, intra_op_threads=1)
+    cache = SynthesisCache(
+        os.path.basename(model_path),
+        {"sample_rate": voice.config.sample_rate},
+        directory=os.environ.get("TTS_CACHE_DIR"),
+    )
+    return SynthesisPool(voice, workers=workers, cache=cache)
+
+
+async def main():
+    metrics_port = os.environ.get("METRICS_PORT")
+    tracer.configure(
+        trace_file=os.environ.get("TRACE_FILE"),
+        metrics_port=int(metrics_port) if metrics_port else None,
+    )
+    SetLogLevel(-1)
+    model, pool = await asyncio.gather(
+        asyncio.to_thread(Model, lang="en-us"), asyncio.to_thread(load_pool)
+    )
+    endpoint_ms = os.environ.get("ASR_ENDPOINT_MS")
+    decode_workers = os.environ.get("ASR_WORKERS")
+    server = AssistantServer(
+        model,
+        pool,
+        {
+            "api_key": os.environ.get("OPENAI_API_KEY"),
+            "api_base": os.environ.get("OPENAI_API_BASE"),
+        },
+        decode_workers=int(decode_workers) if decode_workers else None,
+        endpoint_ms=int(endpoint_ms) if endpoint_ms else None,
+    )
+    host = os.environ.get("SERVER_HOST", "0.0.0.0")
+    port = int(os.environ.get("SERVER_PORT", "8766"))
+    print(f"Serving on ws://{host}:{port}")
+    try:
+        await server.serve(host, port)
+    finally:
+        server.close()
+        tracer.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.error("KeyboardInterrupt detected. Shutting down.")
@@ -0,0 +1,145 @@
+import os
+import re
+import hashlib
+import logging
+import requests
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+Asset = namedtuple("Asset", ["url", "path", "sha256"], defaults=[None])
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+class AssetError(Exception):
+    pass
+
+
+class AssetManager:
+    """Fetches model files concurrently, resumably and atomically.
+
+    Each file is downloaded to a .part file with large buffered writes,
+    resumed with a Range request if a previous attempt was interrupted,
+    checked against its SHA-256 and only then renamed into place. A
+    .sha256 sidecar recording the digest and size marks a file as
+    complete, so a truncated download is never mistaken for a model.
+
+    Assets without a pinned digest are checked against the one the server
+    publishes, Hugging Face sends the SHA-256 of LFS files as X-Linked-Etag."""
+
+    def __init__(self, chunk_size=1 << 20, max_workers=4, timeout=30) -> None:
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="assets"
+        )
+
+    @staticmethod
+    def _published_digest(res):
+        """The SHA-256 named by a response or the redirects that led to it"""
+        for response in [*res.history, res]:
+            etag = response.headers.get("X-Linked-Etag", "").strip('W/"')
+            if _SHA256.fullmatch(etag):
+                return etag
+        return None
+
+    @staticmethod
+    def _sidecar(path):
+        return f"{path}.sha256"
+
+    def _is_complete(self, asset):
+        if not os.path.exists(asset.path):
+            return False
+        size = os.path.getsize(asset.path)
+        try:
+            with open(self._sidecar(asset.path)) as file:
+                digest, expected_size = file.read().split()
+        except (OSError, ValueError):
+            return self._adopt(asset, size)
+        if asset.sha256 and digest != asset.sha256:
+            return False
+        return int(expected_size) == size
+
+    def _adopt(self, asset, size):
+        """Checks a file downloaded before sidecars existed against the server"""
+        try:
+            res = requests.head(asset.url, allow_redirects=True, timeout=self.timeout)
+            remote_size = int(res.headers.get("Content-Length", -1))
+        except (requests.RequestException, ValueError) as e:
+            logging.debug(f"assets: can't verify {asset.path}: {e}")
+            return True
+        if remote_size != size:
+            return False
+        digest = self._hash(asset.path)
+        expected = asset.sha256 or self._published_digest(res)
+        if expected and digest != expected:
+            return False
+        self._write_sidecar(asset.path, digest, size)
+        return True
+
+    def _hash(self, path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(self.chunk_size), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def _write_sidecar(path, digest, size):
+        tmp = f"{path}.sha256.part"
+        with open(tmp, "w") as file:
+            file.write(f"{digest} {size}\n")
+        os.replace(tmp, f"{path}.sha256")
+
+    def _download(self, asset):
+        os.makedirs(os.path.dirname(asset.path), exist_ok=True)
+        part = f"{asset.path}.part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with requests.get(
+            asset.url, headers=headers, stream=True, timeout=self.timeout
+        ) as res:
+            if res.status_code == 416:
+                # Nothing left past offset: fine if the .part file holds
+                # exactly the whole file, otherwise it's stale, start over
+                total = res.headers.get("Content-Range", "").rpartition("/")[2]
+                if total != str(offset):
+                    os.remove(part)
+                    return self._download(asset)
+            else:
+                res.raise_for_status()
+                if res.status_code != 206:
+                    offset = 0
+                mode = "ab" if offset else "wb"
+                with open(part, mode, buffering=self.chunk_size) as file:
+                    for chunk in res.iter_content(chunk_size=self.chunk_size):
+                        file.write(chunk)
+                if "Content-Length" in res.headers:
+                    expected = offset + int(res.headers["Content-Length"])
+                    if os.path.getsize(part) != expected:
+                        raise AssetError(f"{asset.url}: download was cut short")
+
+        expected = asset.sha256 or self._published_digest(res)
+        digest = self._hash(part)
+        if expected and digest != expected:
+            os.remove(part)
+            raise AssetError(f"{asset.url}: checksum mismatch")
+        size = os.path.getsize(part)
+        os.replace(part, asset.path)
+        self._write_sidecar(asset.path, digest, size)
+        logging.debug(f"assets: downloaded {asset.path} ({size} bytes)")
+        return asset.path
+
+    def _ensure(self, asset):
+        if self._is_complete(asset):
+            return asset.path
+        return self._download(asset)
+
+    def fetch(self, assets):
+        """Starts fetching every missing asset, returns their futures"""
+        return [self._executor.submit(self._ensure, asset) for asset in assets]
+
+    def ensure(self, assets):
+        """Fetches every missing asset and waits for all of them"""
+        return [future.result() for future in self.fetch(assets)]
@@ -1,8 +1,10 @@
-import aiohttp
-import copy
-import json
+import time
 import logging
 
+from src.lib.history import ConversationHistory
+from src.lib.sse import SSEDecoder, loads
+from src.lib.tracing import tracer
+
 
 class ChatGeneratorEnd(Exception):
     def __init__(self, final_value):
@@ -34,25 +36,43 @@ class ChatGPT:
         model = config.get("model") or "gpt-3.5-turbo"
         self.model = model
 
+        self.api_base = (config.get("api_base") or ChatGPT.__API_BASE).rstrip("/")
+        self._connection_limit = config.get("connection_limit") or 4
+        self._keepalive_timeout = config.get("keepalive_timeout") or 75
+        self._session = None
+
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {api_key}",
         }
 
-        if messages and len(messages):
-            self.messages = messages
-        else:
-            self.messages = copy.copy(self.__context_messages)
-
-    async def chat(self, message, raiseFullResult=False):
-        self.messages.append(
-            {
-                "role": "user",
-                "content": message,
-            }
+        history_tokens = config.get("history_tokens") or 3000
+        self.history = ConversationHistory(
+            self.__context_messages, budget=history_tokens, model=model
         )
+        for message in messages or []:
+            self.history.append(message)
+
+    @property
+    def messages(self):
+        return self.history.messages()
+
+    async def chat(self, message, raiseFullResult=False, commit=True):
+        """Streams the reply to message.
+
+        With commit=False neither message nor the reply are added to the
+        history, the caller decides what was said with commit() instead."""
+        user_message = {
+            "role": "user",
+            "content": message,
+        }
+        if commit:
+            self.history.append(user_message)
+            messages = self.history.messages()
+        else:
+            messages = self.history.messages() + [user_message]
         body = {
-            "messages": self.messages,
+            "messages": messages,
             "model": self.model,
             "max_tokens": self.max_tokens,
             "top_p": self.top_p,
@@ -61,59 +81,124 @@ class ChatGPT:
 
         headers = self.headers
 
-        logging.debug(f"requesting completion for: {self.messages[-1].get('content')}")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{ChatGPT.__API_BASE}/chat/completions", headers=headers, json=body
-            ) as res:
-                try:
-                    if not res.content:
-                        raise ValueError("No response body")
+        logging.debug(f"requesting completion for: {messages[-1].get('content')}")
+
+        session = self._get_session()
+        started = time.monotonic()
+        async with session.post(
+            f"{self.api_base}/chat/completions", headers=headers, json=body
+        ) as res:
+            chunks = []
+            try:
+                if not res.content:
+                    raise ValueError("No response body")
+
+                decoder = SSEDecoder()
+                done = False
+                first_byte = None
+                async for chunk in res.content.iter_any():
+                    if first_byte is None:
+                        first_byte = time.monotonic()
+                        tracer.record("http.ttfb", started, first_byte)
+                    for data in decoder.feed(chunk):
+                        if data == b"[DONE]":
+                            done = True
+                            break
 
-                    chunks = []
-                    async for chunk in res.content.iter_any():
-                        stringed = chunk.decode()
-                        split_string = stringed.split("data: ")
-                        split = split_string[1:] if len(split_string) > 1 else None
+                        try:
+                            parsed = loads(data)
+                        except ValueError:
+                            parsed = None
 
-                        if not split:
+                        if not parsed:
                             continue
-                        if split == "[DONE]":
-                            break
-
-                        for line in split:
-                            try:
-                                parsed = json.loads(line)
-                            except json.JSONDecodeError:
-                                parsed = None
-
-                            if not parsed:
-                                continue
-                            if (
-                                parsed.get("choices", [{}])[0].get(
-                                    "finish_reason", None
-                                )
-                                is not None
-                            ):
-                                self.messages.append(
+                        if (
+                            parsed.get("choices", [{}])[0].get("finish_reason", None)
+                            is not None
+                        ):
+                            if commit:
+                                self.history.append(
                                     {"role": "assistant", "content": "".join(chunks)}
                                 )
-                                break
-                            delta = (
-                                parsed.get("choices", [{}])[0]
-                                .get("delta", {})
-                                .get("content", None)
-                            )
-                            if not delta:
-                                continue
-                            chunks.append(delta)
-                            yield delta
-                except Exception as e:
-                    logging.debug(f"chat: Exception: {e}")
+                            done = True
+                            break
+                        delta = (
+                            parsed.get("choices", [{}])[0]
+                            .get("delta", {})
+                            .get("content", None)
+                        )
+                        if not delta:
+                            continue
+                        if not chunks:
+                            tracer.record("chat.first_delta", started)
+                        chunks.append(delta)
+                        yield delta
+                    if done:
+                        break
+            except Exception as e:
+                logging.debug(f"chat: Exception: {e}")
+            finally:
+                tracer.record("chat.stream", started, chunks=len(chunks))
 
         if raiseFullResult:
             raise ChatGeneratorEnd(chunks)
 
+    def commit(self, message, reply):
+        """Records an exchange streamed with chat(..., commit=False)"""
+        self.history.append({"role": "user", "content": message})
+        if reply:
+            self.history.append({"role": "assistant", "content": reply})
+
+    @staticmethod
+    def preload():
+        """Imports aiohttp, which takes a while; run it off the event loop"""
+        import aiohttp  # noqa: F401
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._connection_limit,
+                ttl_dns_cache=300,
+                keepalive_timeout=self._keepalive_timeout,
+            )
+            trace_configs = [self._trace_config()] if tracer.enabled else None
+            self._session = aiohttp.ClientSession(
+                connector=connector, trace_configs=trace_configs
+            )
+        return self._session
+
+    @staticmethod
+    def _trace_config():
+        """Records new connections (DNS, TCP and TLS) as http.connect spans"""
+        import aiohttp
+
+        async def on_start(session, context, params):
+            context.connect_started = time.monotonic()
+
+        async def on_end(session, context, params):
+            tracer.record("http.connect", context.connect_started)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(on_start)
+        trace_config.on_connection_create_end.append(on_end)
+        return trace_config
+
+    async def prewarm(self):
+        """Opens a pooled connection ahead of the next chat() call"""
+        try:
+            async with self._get_session().head(
+                f"{self.api_base}/models", headers=self.headers
+            ) as res:
+                await res.release()
+        except Exception as e:
+            logging.debug(f"prewarm: Exception: {e}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
     def reset(self):
-        self.messages = copy.copy(self.__context_messages)
+        self.history.reset()
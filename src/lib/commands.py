@@ -0,0 +1,11 @@
+# The assistant's own commands, shared with the benchmarks and tests
+
+QUIT_PHRASES = ["stop", "quit", "exit", "shut down"]
+WAKE_PHRASES = ["hey gpt", "ok gpt", "chatgpt", "okay gpt"]
+# GPT isn't in the small model's vocabulary, so the sleep grammar spells it;
+# CommandMatcher joins the letters back up when matching WAKE_PHRASES
+WAKE_GRAMMAR = ["hey g p t", "ok g p t", "okay g p t", "chat g p t"]
+# Everything the recognizer listens for while asleep, all in vocabulary
+SLEEP_GRAMMAR = WAKE_GRAMMAR + QUIT_PHRASES
+# CommandMatcher score a transcript needs to count as one of these
+SIMILARITY_THRESHOLD = 0.7
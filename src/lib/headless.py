@@ -0,0 +1,181 @@
+import time
+import wave
+import queue
+import threading
+import numpy as np
+
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from src.lib.output import resample
+
+_NO_STATUS = SimpleNamespace(output_underflow=False, input_overflow=False)
+
+
+class _Clock(threading.Thread):
+    """Calls tick() once per block period, or back to back when not realtime"""
+
+    def __init__(self, period, tick, realtime=True) -> None:
+        super().__init__(daemon=True)
+        self.period = period
+        self.realtime = realtime
+        self._tick = tick
+        self._running = threading.Event()
+        self._closed = False
+
+    @property
+    def active(self):
+        return self._running.is_set()
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self._closed:
+            self._running.wait()
+            if self._closed:
+                return
+            if self.realtime:
+                # A block is only complete once its duration has passed
+                now = time.monotonic()
+                next_tick += self.period
+                if next_tick < now - self.period:
+                    # Resumed after stop(), don't burst to catch up
+                    next_tick = now + self.period
+                time.sleep(max(0.0, next_tick - time.monotonic()))
+            self._tick()
+
+    def start(self):
+        if not self.is_alive():
+            super().start()
+        self._running.set()
+
+    def stop(self):
+        self._running.clear()
+
+    def close(self):
+        self._closed = True
+        self._running.set()
+
+
+class WavFileSource:
+    """Audio source that plays queued WAV files into SpeechRecognizer.
+
+    Stands in for the microphone: open() returns a stream-like object that
+    calls the recognizer's callback with 16-bit blocks at the sample rate,
+    silence when nothing is queued. play() returns a Future resolved with
+    the monotonic time the last block of that file was delivered."""
+
+    def __init__(self, samplerate=16000, realtime=True) -> None:
+        self.samplerate = samplerate
+        self.realtime = realtime
+        self._files = queue.Queue()
+        self._current = None
+        self._callback = None
+        self._clock = None
+        self.blocksize = None
+
+    def open(self, callback, blocksize):
+        self._callback = callback
+        self.blocksize = blocksize
+        self._clock = _Clock(blocksize / self.samplerate, self._tick, self.realtime)
+        return self
+
+    def load(self, path):
+        with wave.open(path, "rb") as wf:
+            if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+                raise ValueError(f"{path}: expected 16-bit mono audio")
+            rate = wf.getframerate()
+            data = wf.readframes(wf.getnframes())
+        if rate != self.samplerate:
+            audio = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+            audio = resample(audio, rate, self.samplerate)
+            data = np.round(audio).astype(np.int16).tobytes()
+        return data
+
+    def play(self, path_or_pcm):
+        pcm = path_or_pcm
+        if isinstance(path_or_pcm, str):
+            pcm = self.load(path_or_pcm)
+        done = Future()
+        self._files.put((pcm, done))
+        return done
+
+    def _tick(self):
+        size = self.blocksize * 2
+        if self._current is None:
+            try:
+                pcm, done = self._files.get_nowait()
+                self._current = [pcm, 0, done]
+            except queue.Empty:
+                pass
+        if self._current is None:
+            block = bytes(size)
+        else:
+            pcm, offset, done = self._current
+            block = pcm[offset : offset + size]
+            self._current[1] += size
+            if self._current[1] >= len(pcm):
+                self._current = None
+                done.set_result(time.monotonic())
+            block = block.ljust(size, b"\0")
+        self._callback(block, self.blocksize, None, None)
+
+    @property
+    def active(self):
+        return self._clock.active
+
+    def start(self):
+        self._clock.start()
+
+    def stop(self):
+        self._clock.stop()
+
+    def abort(self):
+        self._clock.stop()
+
+
+class NullSink:
+    """Drop-in for sd.OutputStream that pulls audio at real-time pace"""
+
+    def __init__(self, samplerate, blocksize, callback, realtime=True, **kwargs):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self._callback = callback
+        self._block = np.zeros((blocksize, 1), dtype=np.float32)
+        self._clock = _Clock(blocksize / samplerate, self._tick, realtime)
+
+    def _tick(self):
+        self._callback(self._block, self.blocksize, None, _NO_STATUS)
+        self.consume(self._block[:, 0])
+
+    def consume(self, block):
+        pass
+
+    def start(self):
+        self._clock.start()
+
+    def close(self):
+        self._clock.close()
+
+
+class CaptureSink(NullSink):
+    """NullSink that keeps what was played and when sound started"""
+
+    def __init__(self, samplerate, blocksize, callback, **kwargs):
+        super().__init__(samplerate, blocksize, callback, **kwargs)
+        self.blocks = []
+        # Monotonic times at which output went from silence to sound
+        self.onsets = []
+        self._sounding = False
+
+    def consume(self, block):
+        sounding = bool(np.any(block))
+        if sounding:
+            self.blocks.append(block.copy())
+            if not self._sounding:
+                self.onsets.append(time.monotonic())
+        self._sounding = sounding
+
+    def audio(self):
+        if not self.blocks:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(self.blocks)
@@ -0,0 +1,94 @@
+import re
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# Roughly what the chat format adds around each message
+_MESSAGE_OVERHEAD = 4
+
+
+class ConversationHistory:
+    """Chat messages kept under a token budget.
+
+    The pinned messages are always sent first. When the turns after them
+    go over budget the oldest ones are folded into a short summary message,
+    and if that isn't enough they are dropped."""
+
+    def __init__(self, pinned, budget=3000, model="gpt-3.5-turbo") -> None:
+        self.budget = budget
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        self._pinned = [(dict(m), self.count_tokens(m)) for m in pinned]
+        self._pinned_tokens = sum(tokens for _, tokens in self._pinned)
+        self.reset()
+
+    def count_tokens(self, message):
+        text = message.get("content") or ""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text)) + _MESSAGE_OVERHEAD
+        return len(text) // 4 + 1 + _MESSAGE_OVERHEAD
+
+    @property
+    def tokens(self):
+        return self._pinned_tokens + self._summary_tokens + self._turn_tokens
+
+    def messages(self):
+        messages = [m for m, _ in self._pinned]
+        if self._summary_lines:
+            messages.append(self._summary_message())
+        messages.extend(m for m, _ in self._turns)
+        return messages
+
+    def append(self, message):
+        tokens = self.count_tokens(message)
+        self._turns.append((message, tokens))
+        self._turn_tokens += tokens
+        self._enforce_budget()
+
+    def reset(self):
+        self._turns = []
+        self._turn_tokens = 0
+        self._summary_lines = []
+        self._summary_tokens = 0
+
+    def _summary_message(self):
+        return {
+            "role": "system",
+            "content": "Earlier in this conversation:\n"
+            + "\n".join(self._summary_lines),
+        }
+
+    @staticmethod
+    def _summarize(message):
+        # The first sentence, capped at a couple dozen words
+        content = (message.get("content") or "").strip()
+        sentence = re.split(r"(?<=[.!?])\s", content, maxsplit=1)[0]
+        words = sentence.split()
+        if len(words) > 24:
+            sentence = " ".join(words[:24]) + "..."
+        return f"- {message.get('role')}: {sentence}"
+
+    def _enforce_budget(self):
+        # Always keep the newest message, it is the one being answered
+        while self.tokens > self.budget and len(self._turns) > 1:
+            message, tokens = self._turns.pop(0)
+            self._turn_tokens -= tokens
+            self._summary_lines.append(self._summarize(message))
+            self._summary_tokens = self.count_tokens(self._summary_message())
+            logging.debug(f"history: summarized {message.get('role')} message")
+        # The summary gets at most a quarter of the budget
+        while self._summary_lines and (
+            self.tokens > self.budget or self._summary_tokens > self.budget // 4
+        ):
+            self._summary_lines.pop(0)
+            self._summary_tokens = (
+                self.count_tokens(self._summary_message()) if self._summary_lines else 0
+            )
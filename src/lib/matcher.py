@@ -0,0 +1,80 @@
+import re
+
+from collections import defaultdict, namedtuple
+
+Match = namedtuple("Match", ["command", "phrase", "score"])
+
+_NON_WORD = re.compile(r"[^a-z0-9' ]+")
+_SPELLED = re.compile(r"\b(?:[a-z] )+[a-z]\b")
+
+
+def normalize(text):
+    """Lowercases, drops punctuation and joins spelled letters ("g p t" -> "gpt")"""
+    text = _NON_WORD.sub(" ", text.lower())
+    text = " ".join(text.split())
+    return _SPELLED.sub(lambda m: m.group(0).replace(" ", ""), text)
+
+
+def features(text):
+    """Word tokens plus character trigrams of the text with spaces removed"""
+    words = text.split()
+    joined = f"#{''.join(words)}#"
+    grams = {joined[i : i + 3] for i in range(len(joined) - 2)}
+    return frozenset(words), frozenset(grams)
+
+
+class CommandMatcher:
+    """Matches utterances against every configured phrase in one pass.
+
+    Phrases are normalized and broken into word and trigram features once,
+    and an inverted index from feature to phrase means an utterance is only
+    scored against phrases it shares something with. The score is the
+    better of word and trigram Jaccard similarity, so "chat gpt" matches
+    "chatgpt" but "stop" doesn't match "stop the music"."""
+
+    def __init__(self, threshold=0.7) -> None:
+        self.threshold = threshold
+        self._phrases = []
+        self._index = defaultdict(list)
+
+    def __len__(self):
+        return len(self._phrases)
+
+    def add(self, command, phrases, threshold=None):
+        for phrase in phrases:
+            words, grams = features(normalize(phrase))
+            phrase_id = len(self._phrases)
+            self._phrases.append(
+                (command, phrase, words, grams, threshold or self.threshold)
+            )
+            for feature in words:
+                self._index[("w", feature)].append(phrase_id)
+            for feature in grams:
+                self._index[("g", feature)].append(phrase_id)
+
+    def match(self, text):
+        """Returns the best Match over its phrase's threshold, or None"""
+        words, grams = features(normalize(text))
+        shared_words = defaultdict(int)
+        shared_grams = defaultdict(int)
+        for feature in words:
+            for phrase_id in self._index.get(("w", feature), ()):
+                shared_words[phrase_id] += 1
+        for feature in grams:
+            for phrase_id in self._index.get(("g", feature), ()):
+                shared_grams[phrase_id] += 1
+
+        best = None
+        for phrase_id in shared_words.keys() | shared_grams.keys():
+            command, phrase, phrase_words, phrase_grams, threshold = self._phrases[
+                phrase_id
+            ]
+            w = shared_words.get(phrase_id, 0)
+            g = shared_grams.get(phrase_id, 0)
+            score = max(
+                w / (len(words) + len(phrase_words) - w) if w else 0.0,
+                g / (len(grams) + len(phrase_grams) - g) if g else 0.0,
+            )
+            if score >= threshold and (best is None or score > best.score):
+                best = Match(command, phrase, score)
+        return best
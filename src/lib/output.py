@@ -0,0 +1,209 @@
+import threading
+import logging
+import numpy as np
+
+from collections import deque
+
+try:
+    import sounddevice as sd
+except OSError:
+    # PortAudio isn't installed, e.g. on a server: only sources and sinks
+    # passed in explicitly can be used
+    sd = None
+
+
+def resample(audio, src_rate, dst_rate):
+    """Linear resampling of a mono float32 signal"""
+    if src_rate == dst_rate or len(audio) == 0:
+        return audio
+    n_out = int(round(len(audio) * dst_rate / src_rate))
+    positions = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+class AudioOutput:
+    """Single process-wide output stream fed from a preallocated ring buffer"""
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def install(cls, output):
+        """Replaces the shared output, e.g. with one writing to a headless sink"""
+        with cls._shared_lock:
+            if cls._shared is not None:
+                cls._shared.close()
+            cls._shared = output
+
+    @classmethod
+    def close_shared(cls):
+        with cls._shared_lock:
+            if cls._shared is not None:
+                logging.debug(f"audio output: {cls._shared.stats()}")
+                cls._shared.close()
+                cls._shared = None
+
+    def __init__(
+        self, sample_rate=22050, buffer_seconds=4.0, blocksize=512, sink=None
+    ) -> None:
+        self.sample_rate = sample_rate
+        self._ring = np.zeros(int(sample_rate * buffer_seconds), dtype=np.float32)
+        self._capacity = len(self._ring)
+        # Monotonic frame counters, the ring offsets are these modulo capacity
+        self._read_pos = 0
+        self._write_pos = 0
+        self._generation = 0
+        self._closed = False
+        # Set by flush() so the expected end of an utterance isn't an underrun
+        self._draining = False
+        # (write position, callback) pairs fired once playback reaches them
+        self._marks = deque()
+        self._cond = threading.Condition()
+        self.underruns = 0
+        self.frames_played = 0
+        # Anything shaped like sd.OutputStream, see src.lib.headless
+        self._stream = (sink or sd.OutputStream)(
+            samplerate=sample_rate,
+            blocksize=blocksize,
+            channels=1,
+            dtype="float32",
+            latency="low",
+            callback=self._callback,
+        )
+        self._stream.start()
+
+    @property
+    def queue_depth(self):
+        """Frames waiting to be played"""
+        return self._write_pos - self._read_pos
+
+    def stats(self):
+        return {
+            "underruns": self.underruns,
+            "queue_depth": self.queue_depth,
+            "frames_played": self.frames_played,
+        }
+
+    def _callback(self, outdata, frames, time, status):
+        """This is called (from a separate thread) for each audio block."""
+        if status.output_underflow:
+            self.underruns += 1
+        out = outdata[:, 0]
+        due = []
+        with self._cond:
+            n = min(frames, self._write_pos - self._read_pos)
+            if n:
+                start = self._read_pos % self._capacity
+                first = min(n, self._capacity - start)
+                out[:first] = self._ring[start : start + first]
+                out[first:n] = self._ring[: n - first]
+                self._read_pos += n
+                self.frames_played += n
+                if n < frames and not self._draining:
+                    # Ran dry before the writer said it was done
+                    self.underruns += 1
+                self._cond.notify_all()
+            while self._marks and self._marks[0][0] <= self._read_pos:
+                due.append(self._marks.popleft()[1])
+        out[n:] = 0
+        for callback in due:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"output mark: Exception: {e}")
+
+    @staticmethod
+    def _as_samples(data):
+        if isinstance(data, np.ndarray):
+            return data.reshape(-1)
+        # Raw 16-bit PCM, viewed in place rather than copied
+        return np.frombuffer(memoryview(data), dtype=np.int16)
+
+    @staticmethod
+    def _copy(src, dst):
+        if src.dtype == np.int16:
+            np.multiply(src, 1.0 / 32768.0, out=dst, casting="unsafe")
+        else:
+            dst[:] = src
+
+    def write(self, data, sample_rate=None):
+        """Queues PCM for playback, blocking while the ring buffer is full.
+
+        Accepts raw int16 bytes/memoryviews or float32 arrays. Returns the
+        number of frames queued, which is short if cancel() was called."""
+        samples = self._as_samples(data)
+        if sample_rate and sample_rate != self.sample_rate:
+            if samples.dtype == np.int16:
+                samples = samples.astype(np.float32) / 32768.0
+            samples = resample(samples, sample_rate, self.sample_rate)
+        total = len(samples)
+        offset = 0
+        with self._cond:
+            self._draining = False
+            generation = self._generation
+            while offset < total:
+                self._cond.wait_for(
+                    lambda: self._closed
+                    or self._generation != generation
+                    or self.queue_depth < self._capacity
+                )
+                if self._closed or self._generation != generation:
+                    return offset
+                n = min(self._capacity - self.queue_depth, total - offset)
+                start = self._write_pos % self._capacity
+                first = min(n, self._capacity - start)
+                self._copy(
+                    samples[offset : offset + first],
+                    self._ring[start : start + first],
+                )
+                self._copy(
+                    samples[offset + first : offset + n], self._ring[: n - first]
+                )
+                self._write_pos += n
+                offset += n
+        return total
+
+    def mark(self, callback):
+        """Calls callback once everything written so far has been played,
+        i.e. when audio written next starts to be heard. Runs on the audio
+        thread, so it should only hand off work (call_soon_threadsafe)."""
+        with self._cond:
+            if self._read_pos < self._write_pos:
+                self._marks.append((self._write_pos, callback))
+                return
+        callback()
+
+    def flush(self):
+        """Blocks until everything queued so far has been handed to the device"""
+        with self._cond:
+            self._draining = True
+            generation = self._generation
+            target = self._write_pos
+            self._cond.wait_for(
+                lambda: self._closed
+                or self._generation != generation
+                or self._read_pos >= target
+            )
+
+    def cancel(self):
+        """Drops queued audio and releases blocked writers (barge-in)"""
+        with self._cond:
+            self._read_pos = self._write_pos
+            # The audio these were waiting for will never be heard
+            self._marks.clear()
+            self._generation += 1
+            self._cond.notify_all()
+
+    def close(self):
+        logging.debug("Closing audio output...")
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._stream.close()
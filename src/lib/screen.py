@@ -1,84 +1,169 @@
-import os
+import shutil
 import asyncio
 import logging
 
-from rich.console import Console
-from rich.control import Control
+from rich.align import Align
+from rich.console import Console, Group
+from rich.live import Live
 from rich.markdown import Markdown
+from rich.text import Text
+
+from src.lib.tracing import tracer
 
 
 class Screen:
-    def __init__(self):
-        self.console = Console(width=os.get_terminal_size().columns)
-        self.control = Control()
-        self.console.clear()
+    """Full-screen Markdown display redrawn by one frame-rate-limited loop.
+
+    write() only updates the target text; the render loop reveals it at
+    typing_cps characters per second and parses the Markdown once per
+    frame, so overlapping writes coalesce and the newest one wins.
+
+    stream() switches to an append-only mode for text that arrives
+    incrementally: a Markdown header over plain text that append() extends
+    and highlight() marks, with no reveal animation or Markdown parsing."""
+
+    HIGHLIGHT_STYLE = "bold yellow"
+
+    def __init__(self, fps=20, typing_cps=100, console=None):
+        self.console = console or Console(width=shutil.get_terminal_size().columns)
+        self.fps = fps
+        self.typing_cps = typing_cps
+        self.frames = 0
+        self._text = ""
+        self._revealed = 0
+        self._streaming = False
+        self._header = ""
+        self._body = Text()
+        self._highlight = None
+        self._rendered = None
+        self._generation = 0
+        self._changed = None
+        self._done = None
+        self._task = None
+        self._live = Live(
+            console=self.console,
+            auto_refresh=False,
+            screen=self.console.is_terminal,
+            transient=True,
+        )
+        self._live.start()
         self.console.show_cursor(False)
 
-    def render(self, text):
-        self.console.clear()
-        self.console.print(Markdown(text, justify="left"), justify="left")
-
-    async def append(self, message, messages):
-        control_sequences = ["#", "**", "*", "[](", "__", "_"]
-        width, height = os.get_terminal_size()
-        x = len(messages[-1])
-        self.console.print(
-            self.control.move_to(
-                x,
-                (height // 2) - max(len(messages), len("".join(messages).split("\n"))),
-            ),
-            justify="left",
+    def _renderable(self, text):
+        return Align(
+            Markdown(text, justify="left"),
+            vertical="middle",
+            height=self.console.height,
         )
-        for j, char in enumerate(message):
-            sequence = next(
-                (seq for seq in control_sequences if char == seq),
-                None,
+
+    def render(self, text):
+        with tracer.span("screen.render"):
+            self._live.update(self._renderable(text), refresh=True)
+        self.frames += 1
+
+    def _render_stream(self):
+        with tracer.span("screen.render", streaming=True):
+            body = self._body.copy()
+            if self._highlight:
+                body.stylize(self.HIGHLIGHT_STYLE, *self._highlight)
+            self._live.update(
+                Align(
+                    Group(Markdown(self._header, justify="left"), body),
+                    vertical="middle",
+                    height=self.console.height,
+                ),
+                refresh=True,
             )
-            if sequence:
-                continue
-            await asyncio.sleep(0.01)
-            self.console.print(char, justify="left")
+        self.frames += 1
 
-    async def write(self, messages):
+    def _ensure_loop(self):
+        if (
+            self._task is None
+            or self._task.done()
+            or self._task.get_loop() is not asyncio.get_running_loop()
+        ):
+            self._changed = asyncio.Event()
+            self._done = asyncio.Condition()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        interval = 1 / self.fps
         try:
-            control_sequences = ["#", "**", "*", "[](", "__", "_"]
-            width, height = os.get_terminal_size()
-            total = ""
-            self.console.clear()
-            for i, message in enumerate(messages):
-                for j, char in enumerate(message):
-                    sequence = next(
-                        (
-                            seq
-                            for seq in control_sequences
-                            if message.startswith(seq, j)
-                        ),
-                        None,
-                    )
-                    if sequence:
-                        total += char
-                        continue
-                    total += char
-                    self.console.print(
-                        self.control.move_to(0, i == 0 and 0 or height - height + i),
-                        justify="left",
-                    )
-                    self.console.line(height // 2 - len(total.split("\n")))
-                    await asyncio.sleep(0.01)
-                    self.console.print(Markdown(total, justify="left"), justify="left")
-                total += "\n"
-
-            self.console.clear()
-            self.console.print(
-                self.control.move_to(0, i == 0 and 0 or height - height + i),
-                justify="left",
-            )
-            self.console.line(height // 2 - len(total.split("\n")))
-            self.console.print(Markdown(total, justify="left"), justify="left")
+            while True:
+                await self._changed.wait()
+                if self._streaming:
+                    state = (self._header, len(self._body), self._highlight)
+                    if state != self._rendered:
+                        self._render_stream()
+                        self._rendered = state
+                    self._changed.clear()
+                    # A write() replaced by stream() must stop waiting
+                    async with self._done:
+                        self._done.notify_all()
+                    await asyncio.sleep(interval)
+                    continue
+                if self.typing_cps:
+                    step = max(1, int(self.typing_cps * interval))
+                    self._revealed = min(len(self._text), self._revealed + step)
+                else:
+                    self._revealed = len(self._text)
+                visible = self._text[: self._revealed]
+                if visible != self._rendered:
+                    self.render(visible)
+                    self._rendered = visible
+                if self._revealed >= len(self._text):
+                    self._changed.clear()
+                    async with self._done:
+                        self._done.notify_all()
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logging.error(f"screen: Exception: {e}")
+
+    def set(self, messages, animate=True):
+        """Replaces the displayed messages without waiting for them to render"""
+        self._ensure_loop()
+        self._streaming = False
+        self._text = "\n".join(messages)
+        self._revealed = 0 if animate else len(self._text)
+        self._generation += 1
+        self._changed.set()
+        return self._generation
 
+    def stream(self, header):
+        """Starts an append-only display under a Markdown header"""
+        self._ensure_loop()
+        self._streaming = True
+        self._header = header
+        self._body = Text()
+        self._highlight = None
+        self._generation += 1
+        self._changed.set()
+
+    def append(self, text):
+        self._body.append(text)
+        self._changed.set()
+
+    def highlight(self, start=None, end=None):
+        """Highlights the streamed characters [start, end), or nothing"""
+        self._highlight = (start, end) if start is not None else None
+        self._changed.set()
+
+    async def write(self, messages):
+        try:
+            generation = self.set(messages)
+            async with self._done:
+                await self._done.wait_for(
+                    lambda: self._generation != generation
+                    or self._revealed >= len(self._text)
+                )
         except Exception as e:
             logging.error(f"print: Exception: {e}")
 
     def quit(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._live.stop()
         self.console.clear()
         self.console.show_cursor(True)
@@ -0,0 +1,92 @@
+import re
+
+# A terminator counts once the character after it has arrived
+_BOUNDARY = re.compile(r"(?:[.!?]+[\"')\]]*|[,;:]|\n)(?=\s)")
+_LAST_WORD = re.compile(r"(\S+?)[.!?]*[\"')\]]*$")
+_SENTENCE_END = re.compile(r"[.!?\n]")
+
+
+class Segmenter:
+    """Splits streamed completion text into segments for TTS.
+
+    The first segment is cut at the first clause or sentence boundary once
+    it has first_min_words words, so speech starts as early as possible.
+    Later segments only end at sentence boundaries with at least min_words,
+    or at a clause boundary once max_words is reached, which gives the
+    synthesizer fewer, more natural chunks while earlier audio plays.
+
+    Abbreviations, initials and list numbers at the start of a line ("Dr.",
+    "J.", "2.") don't end a sentence, and numbers like 3.5 or 1,000 are
+    never split. Segments are returned verbatim, so joining them
+    reproduces the streamed text."""
+
+    ABBREVIATIONS = frozenset(
+        "mr mrs ms dr prof sr jr st vs etc inc ltd co corp dept est approx "
+        "no fig e.g i.e a.m p.m u.s u.k".split()
+    )
+
+    def __init__(self, first_min_words=3, min_words=12, max_words=30) -> None:
+        self.first_min_words = first_min_words
+        self.min_words = min_words
+        self.max_words = max_words
+        self.reset()
+
+    def reset(self):
+        self._buffer = ""
+        self._scan_from = 0
+        self.segments = 0
+
+    def _is_sentence_break(self, boundary):
+        if not _SENTENCE_END.search(boundary.group(0)):
+            return False
+        if boundary.group(0).startswith("\n"):
+            return True
+        word = _LAST_WORD.search(self._buffer, 0, boundary.end())
+        if not word:
+            return True
+        token = word.group(1).lower().lstrip("\"'([")
+        if token in self.ABBREVIATIONS:
+            return False
+        # Initials ("J.")
+        if len(token) == 1 and token.isalpha():
+            return False
+        if token.isdigit():
+            # "2." is a list number only where a line or the buffer starts,
+            # otherwise it ends a sentence ("born in 1990. Then")
+            line_start = self._buffer.rfind("\n", 0, word.start()) + 1
+            return bool(self._buffer[line_start : word.start()].strip())
+        return True
+
+    def feed(self, delta):
+        """Returns the segments completed by delta"""
+        self._buffer += delta
+        ready = []
+        for boundary in _BOUNDARY.finditer(self._buffer, self._scan_from):
+            end = boundary.end()
+            words = len(self._buffer[:end].split())
+            sentence = self._is_sentence_break(boundary)
+            if self.segments == 0:
+                cut = words >= self.first_min_words and (
+                    sentence or boundary.group(0)[0] in ",;:"
+                )
+            else:
+                cut = (sentence and words >= self.min_words) or (
+                    words >= self.max_words
+                )
+            if cut:
+                ready.append(self._buffer[:end])
+                self._buffer = self._buffer[end:]
+                self.segments += 1
+                # Offsets from this match are stale, rescan what's left
+                self._scan_from = 0
+                ready.extend(self.feed(""))
+                return ready
+        # Terminators in the last few characters may still gain a lookahead
+        self._scan_from = max(0, len(self._buffer) - 4)
+        return ready
+
+    def flush(self):
+        """Returns whatever is left once the stream has ended"""
+        rest = self._buffer
+        self.reset()
+        return [rest] if rest.strip() else []
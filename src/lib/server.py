@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+import websockets
+
+from concurrent.futures import ThreadPoolExecutor
+from vosk import KaldiRecognizer
+
+from src.lib.chatgpt import ChatGPT
+from src.lib.segmenter import Segmenter
+from src.lib.speech_recognition import GatedDecoder, Resampler
+from src.lib.tracing import tracer
+
+
+class Transcriber:
+    """One client's recognizer on a Model shared with every other session.
+
+    Decodes through the same GatedDecoder as SpeechRecognizer, after
+    resampling the client's audio to the model's rate."""
+
+    def __init__(
+        self,
+        model,
+        sample_rate,
+        model_sample_rate=16000,
+        endpoint_ms=None,
+        silence_rms=300,
+        vad=True,
+    ) -> None:
+        self._resampler = Resampler(sample_rate, model_sample_rate)
+        self.decoder = GatedDecoder(
+            KaldiRecognizer(model, model_sample_rate),
+            model_sample_rate,
+            endpoint_ms=endpoint_ms,
+            silence_rms=silence_rms,
+            vad=vad,
+        )
+
+    def process(self, data):
+        """Returns the final transcripts completed by this block of PCM"""
+        return self.decoder.process(self._resampler.process(data))
+
+    def reset(self):
+        self.decoder.reset()
+
+
+class Session:
+    """One websocket client: its own recognizer, history and turn.
+
+    Half duplex: audio that arrives while a reply is being spoken is
+    dropped, unless the client sends {"type": "cancel"} to interrupt it."""
+
+    def __init__(self, server, websocket, session_id) -> None:
+        self.server = server
+        self.websocket = websocket
+        self.id = session_id
+        self.transcriber = None
+        self.chat_gpt = ChatGPT(server.chat_config)
+        self._turn = None
+
+    async def _send(self, **message):
+        await self.websocket.send(json.dumps(message))
+
+    async def _start(self, sample_rate):
+        self.transcriber = Transcriber(
+            self.server.model, sample_rate, endpoint_ms=self.server.endpoint_ms
+        )
+        await self._send(type="ready", sample_rate=self.server.pool.sample_rate)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        async for message in self.websocket:
+            if isinstance(message, str):
+                await self._control(json.loads(message))
+                continue
+            if self.transcriber is None:
+                await self._start(16000)
+            if self._turn is not None and not self._turn.done():
+                continue
+            received = time.monotonic()
+            texts = await loop.run_in_executor(
+                self.server.executor, self.transcriber.process, message
+            )
+            if texts:
+                self._turn = asyncio.create_task(
+                    self._respond(" ".join(texts), received)
+                )
+
+    async def _control(self, message):
+        kind = message.get("type")
+        if kind == "start":
+            await self._start(int(message.get("sample_rate") or 16000))
+        elif kind == "cancel":
+            self.cancel()
+        elif kind == "reset":
+            self.chat_gpt.reset()
+
+    async def _respond(self, text, speech_end):
+        """Streams the reply to text as deltas and PCM, in segment order"""
+        await self._send(type="transcript", text=text)
+        segments = asyncio.Queue()
+        sender = asyncio.create_task(self._send_audio(segments, speech_end))
+        segmenter = Segmenter()
+        sent = []
+        try:
+            async for chunk in self.chat_gpt.chat(text, commit=False):
+                await self._send(type="delta", text=chunk)
+                sent.append(chunk)
+                for segment in segmenter.feed(chunk):
+                    segments.put_nowait(self.server.pool.submit(self.id, segment))
+            for segment in segmenter.flush():
+                segments.put_nowait(self.server.pool.submit(self.id, segment))
+            segments.put_nowait(None)
+            await sender
+            self.chat_gpt.commit(text, "".join(sent).strip())
+            tracer.record("server.turn", speech_end)
+            await self._send(type="turn_end")
+        except asyncio.CancelledError:
+            sender.cancel()
+            # Only the reply the client was sent goes into the history
+            self.chat_gpt.commit(text, "".join(sent).strip())
+            try:
+                await self._send(type="turn_end", cancelled=True)
+            except websockets.ConnectionClosed:
+                pass
+        except Exception as e:
+            logging.error(f"session {self.id}: Exception: {e}")
+            sender.cancel()
+        finally:
+            self.transcriber.reset()
+
+    async def _send_audio(self, segments, speech_end):
+        first = True
+        while True:
+            pcm = await segments.get()
+            if pcm is None:
+                return
+            while True:
+                chunk = await pcm.get()
+                if chunk is None:
+                    break
+                if first:
+                    tracer.record("server.first_audio", speech_end)
+                    first = False
+                await self.websocket.send(chunk)
+
+    def cancel(self):
+        self.server.pool.cancel(self.id)
+        if self._turn is not None:
+            self._turn.cancel()
+
+    async def close(self):
+        self.cancel()
+        await self.chat_gpt.close()
+
+
+class AssistantServer:
+    """Serves voice sessions over websockets from one Vosk model and voice.
+
+    Clients send {"type": "start", "sample_rate": N} and then 16-bit mono
+    PCM as binary messages. The server answers with JSON messages (ready,
+    transcript, delta, turn_end) and the reply's PCM as binary messages at
+    the sample rate given in ready."""
+
+    def __init__(
+        self, model, pool, chat_config, decode_workers=None, endpoint_ms=None
+    ) -> None:
+        self.model = model
+        self.pool = pool
+        # Fails here rather than on the first connection without an API key
+        ChatGPT(chat_config)
+        self.chat_config = chat_config
+        self.endpoint_ms = endpoint_ms
+        # Kaldi releases the GIL, so decoding scales across these threads
+        self.executor = ThreadPoolExecutor(decode_workers or os.cpu_count())
+        self.sessions = {}
+        self._ids = itertools.count(1)
+
+    async def handle(self, websocket):
+        session = Session(self, websocket, next(self._ids))
+        self.sessions[session.id] = session
+        logging.debug(f"session {session.id} connected")
+        try:
+            await session.run()
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            logging.error(f"session {session.id}: Exception: {e}")
+        finally:
+            await session.close()
+            del self.sessions[session.id]
+            logging.debug(f"session {session.id} closed")
+
+    async def serve(self, host="0.0.0.0", port=8766):
+        async with websockets.serve(self.handle, host, port, max_size=2**20):
+            await asyncio.Future()
+
+    def close(self):
+        self.pool.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
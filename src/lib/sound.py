@@ -1,54 +1,101 @@
-import sounddevice as sd
 import numpy as np
 import os
 import wave
 
+from src.lib.output import AudioOutput, resample
+from src.lib.tracing import tracer
+
+_ASSETS = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../assets")
+)
+
+
+class SoundBank:
+    """Sound files decoded once into read-only float32 arrays"""
+
+    def __init__(self, directory=_ASSETS, volume=0.6, sample_rate=None, cache_dir=None):
+        self.directory = directory
+        self.volume = volume
+        self.sample_rate = sample_rate
+        self.cache_dir = cache_dir
+        self._sounds = {}
+        for file in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(file)
+            if extension == ".wav":
+                self._sounds[name] = self._load(os.path.join(directory, file))
+
+    def _decode(self, file_path):
+        with wave.open(file_path, "rb") as wf:
+            sample_rate = wf.getframerate()
+            audio_data = wf.readframes(wf.getnframes())
+        audio = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
+        audio *= self.volume / 32767.0
+        if self.sample_rate:
+            audio = resample(audio, sample_rate, self.sample_rate)
+            sample_rate = self.sample_rate
+        return np.ascontiguousarray(np.clip(audio, -1.0, 1.0)), sample_rate
+
+    def _load(self, file_path):
+        if not self.cache_dir:
+            audio, sample_rate = self._decode(file_path)
+            audio.flags.writeable = False
+            return audio, sample_rate
+
+        # Cache the decoded array as .npy and memory-map it back
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        rate = self.sample_rate
+        if not rate:
+            with wave.open(file_path, "rb") as wf:
+                rate = wf.getframerate()
+        cache_path = os.path.join(self.cache_dir, f"{name}.{rate}.{self.volume}.npy")
+        if not os.path.exists(cache_path) or os.path.getmtime(
+            cache_path
+        ) < os.path.getmtime(file_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            audio, rate = self._decode(file_path)
+            np.save(cache_path, audio)
+        return np.load(cache_path, mmap_mode="r"), rate
+
+    def get(self, name):
+        """Returns (audio, sample_rate) for a sound file name without extension"""
+        return self._sounds[name]
+
 
 class Audio:
+    bank = None
+
+    @staticmethod
+    def preload(cache_dir=None):
+        Audio.bank = SoundBank(
+            sample_rate=AudioOutput.shared().sample_rate, cache_dir=cache_dir
+        )
+
     @staticmethod
     def play_audio(audio, sample_rate=22050, volume=1.0):
         # Ensure audio is in the correct float32 format with values between -1 and 1
-        if isinstance(audio, (list, np.ndarray)):
-            audio_data = []
-            for n in audio:
-                if isinstance(n, np.ndarray):
-                    adjusted_audio = np.float32(n.astype(np.float32) * volume)
-                    audio_data.append(np.clip(adjusted_audio, -1.0, 1.0))
-                elif isinstance(n, (np.float32, float)):
-                    adjusted_audio = np.float32(n * volume)
-                    audio_data.append(np.clip(np.array([adjusted_audio]), -1.0, 1.0))
-                elif isinstance(n, int):
-                    float_val = np.float32(
-                        n / float(2**15)
-                    )  # Convert 16-bit int to float between -1 and 1
-                    adjusted_audio = np.float32(float_val * volume)
-                    audio_data.append(np.clip(np.array([adjusted_audio]), -1.0, 1.0))
-            audio_data = np.concatenate(audio_data)
-        elif isinstance(audio, np.ndarray):
-            adjusted_audio = np.float32(audio.astype(np.float32) * volume)
-            audio_data = np.clip(adjusted_audio, -1.0, 1.0)
+        if isinstance(audio, list) and audio and isinstance(audio[0], np.ndarray):
+            audio_data = np.concatenate(audio)
+        else:
+            audio_data = np.asarray(audio)
+        if np.issubdtype(audio_data.dtype, np.integer):
+            # Convert 16-bit int to float between -1 and 1
+            audio_data = audio_data.astype(np.float32) / float(2**15)
+        audio_data = np.clip(audio_data.astype(np.float32) * volume, -1.0, 1.0)
 
         # Play the audio
-        sd.play(audio_data, samplerate=sample_rate, blocking=True)
+        output = AudioOutput.shared()
+        output.write(audio_data, sample_rate)
+        output.flush()
         return
 
     @staticmethod
     def play_sound_file(filename, extension="wav"):
-        dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.normpath(
-            os.path.join(dir, "../assets/", f"{filename}.{extension}")
-        )
-        wf = wave.open(file_path, "rb")
-
-        # Read the entire audio data
-        n_frames = wf.getnframes()
-        audio_data = wf.readframes(n_frames)
-        audio_array = (
-            np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32767.0
-        )  # Convert to float32
-
-        # Get the sample rate
-        sample_rate = wf.getframerate()
+        if Audio.bank is None:
+            Audio.preload()
+        audio, sample_rate = Audio.bank.get(filename)
 
-        Audio.play_audio(audio_array, sample_rate, 0.6)
+        output = AudioOutput.shared()
+        with tracer.span("audio.play", sound=filename):
+            output.write(audio, sample_rate)
+            output.flush()
         return
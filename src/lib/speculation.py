@@ -0,0 +1,103 @@
+import time
+import asyncio
+import logging
+
+from collections import deque
+
+from src.lib.matcher import normalize
+from src.lib.tracing import tracer
+
+
+class Speculation:
+    """A completion requested for a partial transcript, buffered until the
+    final transcript says whether it can be used"""
+
+    def __init__(self, chat_gpt, text) -> None:
+        self.text = text
+        self.key = normalize(text)
+        self.started = time.monotonic()
+        self.first_token = None
+        self._chunks = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(chat_gpt))
+
+    async def _run(self, chat_gpt):
+        try:
+            # commit=False: nothing reaches the history unless it is used
+            async for chunk in chat_gpt.chat(self.text, commit=False):
+                if self.first_token is None:
+                    self.first_token = time.monotonic()
+                self._chunks.put_nowait(chunk)
+        except Exception as e:
+            logging.debug(f"speculation: Exception: {e}")
+        finally:
+            self._chunks.put_nowait(None)
+
+    async def stream(self):
+        """Yields the buffered reply, then the rest as it arrives"""
+        try:
+            while True:
+                chunk = await self._chunks.get()
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        self._task.cancel()
+
+
+class Speculator:
+    """Starts completions on stable partial transcripts.
+
+    start() is called whenever a partial settles; take() is called with
+    the final transcript and returns the speculative reply stream if the
+    texts match, or None after cancelling it. Hits, misses and the time
+    the early start saved are kept for stats()."""
+
+    def __init__(self, chat_gpt) -> None:
+        self.chat_gpt = chat_gpt
+        self.hits = 0
+        self.misses = 0
+        self.saved = deque(maxlen=100)
+        self._current = None
+
+    def start(self, text):
+        if self._current is not None:
+            if self._current.key == normalize(text):
+                return
+            self._current.cancel()
+        self._current = Speculation(self.chat_gpt, text)
+
+    def take(self, text):
+        speculation, self._current = self._current, None
+        if speculation is None:
+            return None
+        if speculation.key != normalize(text):
+            speculation.cancel()
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.monotonic()
+        # The normal request would have started now; the reply is ahead by
+        # that much, or by its whole time to first token if that has passed
+        saved = now - speculation.started
+        if speculation.first_token is not None:
+            saved = min(saved, speculation.first_token - speculation.started)
+        self.saved.append(saved)
+        tracer.record("speculation.saved", now - saved, now)
+        return speculation.stream()
+
+    def cancel(self):
+        if self._current is not None:
+            self._current.cancel()
+            self._current = None
+
+    def stats(self):
+        attempts = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / attempts if attempts else 0.0,
+            "mean_saved": sum(self.saved) / len(self.saved) if self.saved else 0.0,
+        }
@@ -1,13 +1,25 @@
 import os
 import sys
-import sounddevice as sd
+import time
+import queue
+import threading
 import json
 import asyncio
 import logging
+import numpy as np
 
+try:
+    import sounddevice as sd
+except OSError:
+    # Without PortAudio a source must be passed in, see server mode
+    sd = None
+
+from collections import deque
 from typing import List, Callable
 from vosk import Model, KaldiRecognizer, SetLogLevel
 
+from src.lib.tracing import tracer
+
 
 class HiddenPrints:
     def __enter__(self):
@@ -19,26 +31,419 @@ class HiddenPrints:
         sys.stdout = self._original_stdout
 
 
+class Resampler:
+    """Streaming resampler for 16-bit mono PCM blocks.
+
+    Integer ratios (48k -> 16k) average each group of input samples, which
+    doubles as a cheap anti-aliasing filter. Other ratios (44.1k -> 16k) use
+    linear interpolation. State carries across blocks so there are no seams."""
+
+    def __init__(self, src_rate, dst_rate) -> None:
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.ratio = src_rate / dst_rate
+        self._factor = src_rate // dst_rate if src_rate % dst_rate == 0 else None
+        self._pending = np.zeros(0, dtype=np.float32)
+        # Position of the next output sample relative to self._pending[0]
+        self._next = 0.0
+
+    def process(self, data):
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if self.src_rate == self.dst_rate:
+            return data
+        x = np.concatenate((self._pending, samples))
+        if self._factor:
+            usable = len(x) - len(x) % self._factor
+            out = x[:usable].reshape(-1, self._factor).mean(axis=1)
+            self._pending = x[usable:]
+        else:
+            if len(x) < 2:
+                self._pending = x
+                return b""
+            positions = np.arange(self._next, len(x) - 1, self.ratio)
+            out = np.interp(positions, np.arange(len(x)), x)
+            if len(positions):
+                self._next = positions[-1] + self.ratio
+            self._next -= len(x) - 1
+            self._pending = x[-1:]
+        return np.round(out).astype(np.int16).tobytes()
+
+
+class Endpointer:
+    """Ends an utterance once the partial result and the audio have settled.
+
+    Vosk only emits a final result after its own silence detection, which
+    trails the end of speech. This calls it early when the partial text has
+    not changed and the input has stayed quiet for endpoint_ms of audio."""
+
+    def __init__(self, sample_rate, endpoint_ms=300, silence_rms=300) -> None:
+        self.sample_rate = sample_rate
+        self.endpoint_frames = int(sample_rate * endpoint_ms / 1000)
+        self.silence_rms = silence_rms
+        self.reset()
+
+    def reset(self):
+        self._partial = ""
+        self._stable_frames = 0
+        self._quiet_frames = 0
+
+    @staticmethod
+    def rms(data):
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+
+    def update(self, data, partial):
+        """Returns True when the utterance in partial should be finalized"""
+        frames = len(data) // 2
+        if partial != self._partial:
+            self._partial = partial
+            self._stable_frames = 0
+        else:
+            self._stable_frames += frames
+        if self.rms(data) < self.silence_rms:
+            self._quiet_frames += frames
+        else:
+            self._quiet_frames = 0
+        return bool(
+            partial
+            and self._stable_frames >= self.endpoint_frames
+            and self._quiet_frames >= self.endpoint_frames
+        )
+
+
+class VoiceActivityDetector:
+    """Energy and zero-crossing gate that keeps silence away from the decoder.
+
+    Blocks louder than the adaptive noise floor with a speech-like
+    zero-crossing rate open the gate. A short pre-roll of the preceding
+    blocks is released with the onset so the first word isn't clipped, and
+    the gate stays open for a hangover so the decoder sees the trailing
+    silence it needs to finalize."""
+
+    def __init__(
+        self,
+        sample_rate,
+        min_rms=300,
+        noise_ratio=3.0,
+        max_zcr=0.35,
+        preroll_ms=300,
+        hangover_ms=600,
+    ) -> None:
+        self.min_rms = min_rms
+        self.noise_ratio = noise_ratio
+        self.max_zcr = max_zcr
+        self.preroll_frames = int(sample_rate * preroll_ms / 1000)
+        self.hangover_frames = int(sample_rate * hangover_ms / 1000)
+        self.sample_rate = sample_rate
+        self.noise_floor = 0.0
+        self.active = False
+        self.skipped_blocks = 0
+        # Raised by SpeechRecognizer.guard_echo() while the assistant talks
+        self.echo_ratio = 1.0
+        self.onset_frames = 0
+        self._speech_run = 0
+        self._preroll = deque()
+        self._preroll_len = 0
+        self._hangover_left = 0
+
+    @property
+    def threshold(self):
+        return max(self.min_rms, self.noise_floor * self.noise_ratio) * (
+            self.echo_ratio
+        )
+
+    def is_speech(self, data):
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if len(samples) < 2:
+            return False
+        rms = float(np.sqrt(np.mean(samples * samples)))
+        signs = np.signbit(samples)
+        zcr = np.count_nonzero(signs[1:] != signs[:-1]) / (len(samples) - 1)
+        speech = rms >= self.threshold and zcr <= self.max_zcr
+        if not speech:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+    def process(self, data):
+        """Returns (blocks to decode, whether the utterance just ended)"""
+        frames = len(data) // 2
+        speech = self.is_speech(data)
+        self._speech_run = self._speech_run + frames if speech else 0
+        if speech and (self.active or self._speech_run >= self.onset_frames):
+            self._hangover_left = self.hangover_frames
+            if not self.active:
+                self.active = True
+                blocks = list(self._preroll) + [data]
+                self._preroll.clear()
+                self._preroll_len = 0
+                return blocks, False
+            return [data], False
+
+        if self.active:
+            self._hangover_left -= frames
+            if self._hangover_left > 0:
+                return [data], False
+            self.active = False
+            return [data], True
+
+        self.skipped_blocks += 1
+        self._preroll.append(data)
+        self._preroll_len += frames
+        while self._preroll and self._preroll_len - len(self._preroll[0]) // 2 >= (
+            self.preroll_frames
+        ):
+            self._preroll_len -= len(self._preroll.popleft()) // 2
+        return [], False
+
+    def close(self):
+        """Closes the gate at once, dropping the hangover and pre-roll"""
+        self.active = False
+        self._hangover_left = 0
+        self._speech_run = 0
+        self._preroll.clear()
+        self._preroll_len = 0
+
+
+class GatedDecoder:
+    """Decodes one stream of 16-bit mono PCM into final transcripts.
+
+    The VAD keeps silence away from Kaldi, the optional Endpointer
+    finalizes early once the partial settles, and an utterance still open
+    when the gate closes is flushed with FinalResult. Hooks are called on
+    the decoding thread: on_speech_start() whenever the gate opens and
+    on_stable_partial(text) once a partial has held still for stable_ms."""
+
+    # Vosk turns various air sounds into "huh"
+    NOISE = {"huh"}
+
+    def __init__(
+        self,
+        rec,
+        sample_rate=16000,
+        endpoint_ms=None,
+        silence_rms=300,
+        vad=True,
+        on_speech_start=None,
+        on_stable_partial=None,
+        stable_ms=400,
+    ) -> None:
+        self.rec = rec
+        self.sample_rate = sample_rate
+        self.endpointer = (
+            Endpointer(sample_rate, endpoint_ms, silence_rms) if endpoint_ms else None
+        )
+        self.vad = (
+            VoiceActivityDetector(sample_rate, min_rms=silence_rms) if vad else None
+        )
+        self.on_speech_start = on_speech_start
+        self.on_stable_partial = on_stable_partial
+        # Audio frames a partial must stay unchanged before it counts as stable
+        self.stable_partial_frames = int(sample_rate * stable_ms / 1000)
+        self.capturing = False
+        self._partial = ""
+        self._partial_frames = 0
+        self._partial_sent = False
+        # Set from other threads, acted on before the next block
+        self._requested_rec = rec
+        self._reset_requested = False
+
+    def use(self, rec):
+        """Switches to rec before the next block is decoded"""
+        self._requested_rec = rec
+
+    def guard_echo(self, enabled, ratio=2.0, onset_ms=200):
+        """Makes the VAD ignore the assistant's own voice while it speaks.
+
+        The gate needs input ratio times louder than usual, sustained for
+        onset_ms, before it opens. Enabling it also closes the gate and
+        drops the utterance in progress before the next block: an open gate
+        skips the onset check, so echo arriving in the hangover of the last
+        utterance would be decoded as speech. Speech over the playback has
+        to open the gate again, which calls on_speech_start."""
+        if self.vad is None:
+            return
+        self.vad.echo_ratio = ratio if enabled else 1.0
+        self.vad.onset_frames = (
+            int(self.sample_rate * onset_ms / 1000) if enabled else 0
+        )
+        if enabled:
+            self._reset_requested = True
+
+    def reset(self):
+        """Drops the utterance in progress and closes the gate"""
+        self.rec.Reset()
+        self.capturing = False
+        self._partial = ""
+        self._partial_frames = 0
+        self._partial_sent = False
+        if self.endpointer:
+            self.endpointer.reset()
+        if self.vad:
+            self.vad.close()
+
+    def _switch_recognizer(self):
+        rec = self._requested_rec
+        if rec is self.rec:
+            return
+        self.rec.Reset()
+        self.rec = rec
+        self.capturing = False
+        if self.endpointer:
+            self.endpointer.reset()
+
+    def process(self, data):
+        """Returns the final transcripts completed by this block"""
+        self._switch_recognizer()
+        if self._reset_requested:
+            self._reset_requested = False
+            self.reset()
+
+        if not self.vad:
+            texts = [self._decode(data)]
+        else:
+            was_active = self.vad.active
+            blocks, ended = self.vad.process(data)
+            if self.vad.active and not was_active and self.on_speech_start:
+                self.on_speech_start()
+            texts = [self._decode(block) for block in blocks]
+            if ended and self.capturing:
+                # The gate closed while Vosk still holds a partial utterance
+                self.capturing = False
+                if self.endpointer:
+                    self.endpointer.reset()
+                texts.append(json.loads(self.rec.FinalResult()).get("text"))
+        texts = [text for text in map(self._clean, texts) if text]
+        if texts:
+            self._partial = ""
+        return [text for text in texts if text not in self.NOISE]
+
+    @staticmethod
+    def _clean(text):
+        if text and "[unk]" in text:
+            text = " ".join(word for word in text.split() if word != "[unk]")
+        return text
+
+    def _decode(self, data):
+        if not data:
+            self.capturing = False
+            return None
+
+        if self.rec.AcceptWaveform(data):
+            if self.endpointer:
+                self.endpointer.reset()
+            parsed = json.loads(self.rec.Result())
+            text = parsed.get("text")
+            if not text:
+                self.capturing = False
+            return text
+
+        parsed = json.loads(self.rec.PartialResult())
+        partial = parsed.get("partial") if parsed else None
+        self.capturing = bool(partial)
+        if self.on_stable_partial:
+            self._track_partial(data, partial)
+        if self.endpointer and self.endpointer.update(data, partial):
+            self.endpointer.reset()
+            self.capturing = False
+            # FinalResult flushes the decoder and starts a fresh utterance
+            return json.loads(self.rec.FinalResult()).get("text")
+        return None
+
+    def _track_partial(self, data, partial):
+        if partial != self._partial:
+            self._partial = partial
+            self._partial_frames = 0
+            self._partial_sent = False
+            return
+        self._partial_frames += len(data) // 2
+        if (
+            partial
+            and not self._partial_sent
+            and self._partial_frames >= self.stable_partial_frames
+        ):
+            self._partial_sent = True
+            text = self._clean(partial)
+            if text and text not in self.NOISE:
+                self.on_stable_partial(text)
+
+
 class SpeechRecognizer:
     """Input class for handling audio input"""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_pending_blocks=32,
+        blocksize=None,
+        endpoint_ms=None,
+        silence_rms=300,
+        model_sample_rate=16000,
+        vad=True,
+        wake_phrases=None,
+        source=None,
+    ) -> None:
         self.q = asyncio.Queue()
-        default_input_device = sd.default.device[0]
-        device_info = sd.query_devices(default_input_device, "input")
-        sample_rate = int(device_info["default_samplerate"])
-        self._capturing = False
+        self._speech_start_callbacks = []
+        self._stable_partial_callbacks = []
+        # Audio blocks waiting for the decoder thread, oldest dropped when full
+        self._blocks = queue.Queue(maxsize=max_pending_blocks)
+        self._decode_thread = None
+        self.dropped_blocks = 0
+        self.decode_times = deque(maxlen=200)
+        self.queue_lags = deque(maxlen=200)
+        if source is None:
+            default_input_device = sd.default.device[0]
+            device_info = sd.query_devices(default_input_device, "input")
+            sample_rate = int(device_info["default_samplerate"])
+        else:
+            sample_rate = source.samplerate
+        # 100ms blocks by default, Vosk can't finalize before a block arrives
+        self.blocksize = blocksize or sample_rate // 10
+        # Capture at the device rate, decode at the rate the model was built for
+        self.sample_rate = model_sample_rate
+        self._resampler = Resampler(sample_rate, model_sample_rate)
         self._loop = None
         SetLogLevel(-1)
         self.model = Model(lang="en-us")
-        self._input_stream = sd.RawInputStream(
-            samplerate=sample_rate,
-            blocksize=8000,
-            dtype="int16",
-            channels=1,
-            callback=self._callback,
+        if source is None:
+            self._input_stream = sd.RawInputStream(
+                samplerate=sample_rate,
+                blocksize=self.blocksize,
+                dtype="int16",
+                channels=1,
+                callback=self._callback,
+            )
+        else:
+            # e.g. src.lib.headless.WavFileSource
+            self._input_stream = source.open(self._callback, self.blocksize)
+        self._full_rec = KaldiRecognizer(self.model, model_sample_rate)
+        self._wake_rec = None
+        self.decoder = GatedDecoder(
+            self._full_rec,
+            model_sample_rate,
+            endpoint_ms=endpoint_ms,
+            silence_rms=silence_rms,
+            vad=vad,
+            on_speech_start=self._speech_started,
         )
-        self.rec = KaldiRecognizer(self.model, sample_rate)
+        if wake_phrases:
+            self.set_wake_phrases(wake_phrases)
+            self.use_wake_grammar()
+
+    def set_wake_phrases(self, phrases):
+        """Builds the recognizer used while asleep, restricted to phrases.
+
+        Anything outside the grammar decodes to [unk], which is dropped, so
+        the decoder searches a handful of paths instead of the full model."""
+        grammar = json.dumps(list(phrases) + ["[unk]"])
+        self._wake_rec = KaldiRecognizer(self.model, self.sample_rate, grammar)
+
+    def use_wake_grammar(self):
+        if self._wake_rec is None:
+            raise ValueError("set_wake_phrases() must be called first")
+        self.decoder.use(self._wake_rec)
+
+    def use_full_vocabulary(self):
+        self.decoder.use(self._full_rec)
 
     def _int_or_str(self, text):
         """Helper function for argument parsing."""
@@ -47,64 +452,122 @@ class SpeechRecognizer:
         except ValueError:
             return text
 
-    def _callback(self, indata, frames, time, status):
+    def _callback(self, indata, frames, time_info, status):
         """This is called (from a separate thread) for each audio block."""
         if status:
             logging.debug(status, file=sys.stderr)
-        b = bytes(indata)
-        loop = self._loop
-        asyncio.run_coroutine_threadsafe(self.q.put(b), loop)
+        block = (time.monotonic(), bytes(indata))
+        try:
+            self._blocks.put_nowait(block)
+        except queue.Full:
+            try:
+                self._blocks.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped_blocks += 1
+            self._blocks.put_nowait(block)
+
+    def _decode_loop(self):
+        """Runs Kaldi on its own thread, posting final results to the loop"""
+        while True:
+            block = self._blocks.get()
+            if block is None:
+                return
+            queued_at, data = block
+            started = time.monotonic()
+            self.queue_lags.append(started - queued_at)
+            try:
+                texts = self.decoder.process(self._resampler.process(data))
+            except Exception as e:
+                logging.debug(f"asr decode Exception: {e}")
+                continue
+            finally:
+                self.decode_times.append(time.monotonic() - started)
+            for text in texts:
+                # From capture of the block that ended the utterance to its result
+                tracer.record("asr.final", queued_at, words=len(text.split()))
+                self._loop.call_soon_threadsafe(self.q.put_nowait, text)
+
+    def _speech_started(self):
+        for callback in self._speech_start_callbacks:
+            self._loop.call_soon_threadsafe(callback)
+
+    def _partial_stable(self, text):
+        for callback in self._stable_partial_callbacks:
+            self._loop.call_soon_threadsafe(callback, text)
+
+    def stats(self):
+        """Decode time per block and callback-to-decoder lag, in seconds"""
+
+        def summarize(values):
+            if not values:
+                return {"mean": 0.0, "max": 0.0}
+            values = list(values)
+            return {"mean": sum(values) / len(values), "max": max(values)}
+
+        return {
+            "decode_time": summarize(self.decode_times),
+            "queue_lag": summarize(self.queue_lags),
+            "pending_blocks": self._blocks.qsize(),
+            "dropped_blocks": self.dropped_blocks,
+            "skipped_blocks": self.decoder.vad.skipped_blocks
+            if self.decoder.vad
+            else 0,
+        }
 
     def kill(self):
         logging.debug("Killing speech recognizer...")
-        self._capturing = False
+        self.decoder.capturing = False
         self._input_stream.abort()
+        if self._decode_thread is not None:
+            self._blocks.put(None)
+            self._decode_thread.join()
+            self._decode_thread = None
+
+    def on_speech_start(self, callback):
+        """Calls callback on the event loop whenever the VAD gate opens"""
+        self._speech_start_callbacks.append(callback)
+
+    def on_stable_partial(self, callback, stable_ms=400):
+        """Calls callback(text) on the event loop once a partial result has
+        stayed the same for stable_ms of audio, at most once per partial"""
+        self.decoder.stable_partial_frames = int(self.sample_rate * stable_ms / 1000)
+        self.decoder.on_stable_partial = self._partial_stable
+        self._stable_partial_callbacks.append(callback)
+
+    @property
+    def can_barge_in(self):
+        return self.decoder.vad is not None
+
+    def guard_echo(self, enabled, ratio=2.0, onset_ms=200):
+        """Makes the VAD ignore the assistant's own voice, see GatedDecoder"""
+        self.decoder.guard_echo(enabled, ratio, onset_ms)
 
     def is_capturing(self):
-        return self._capturing
+        vad = self.decoder.vad
+        return self.decoder.capturing or bool(vad and vad.active)
 
     def pause(self):
-        self._capturing = False
+        self.decoder.capturing = False
         self._input_stream.stop()
 
     def resume(self):
-        self._input_stream.start()
+        if not self._input_stream.active:
+            self._input_stream.start()
 
     async def start(self, subscribers: List[Callable]):
         logging.debug("ASR starting...")
         try:
             self._loop = asyncio.get_event_loop()
+            self._decode_thread = threading.Thread(
+                target=self._decode_loop, daemon=True
+            )
+            self._decode_thread.start()
             self._input_stream.start()
             while True:
-                data = await self.q.get()
-                if not data:
-                    self._capturing = False
-                    continue
-
-                if self.rec.AcceptWaveform(data):
-                    d = self.rec.Result()
-                    parsed = json.loads(d)
-                    text = parsed.get("text")
-                    if not text:
-                        self._capturing = False
-                        continue
-
-                    for sub in subscribers:
-                        await sub(text)
-                else:
-                    d = self.rec.PartialResult()
-                    parsed = json.loads(d)
-                    if not parsed:
-                        self._capturing = False
-                        continue
-                    if not parsed.get("partial"):
-                        self._capturing = False
-                        continue
-                    text = parsed.get("partial")
-                    if not text:
-                        self._capturing = False
-                        continue
-                    self._capturing = True
+                text = await self.q.get()
+                for sub in subscribers:
+                    await sub(text)
         except asyncio.CancelledError as e:
             logging.debug(f"asr asyncio.CancelledError: {e}")
             self.kill()
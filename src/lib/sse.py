@@ -0,0 +1,56 @@
+import json
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+class SSEDecoder:
+    """Incremental text/event-stream decoder.
+
+    Bytes are fed in as they arrive from the socket, split at arbitrary
+    offsets. Incomplete lines are carried over in a buffer, and the payload
+    of each event is returned only once its terminating blank line arrives."""
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._data = []
+
+    def feed(self, chunk):
+        """Returns the data payloads of every event completed by chunk"""
+        self._buffer += chunk
+        events = []
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line = self._buffer[start:end]
+            start = end + 1
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                if self._data:
+                    events.append(b"\n".join(self._data))
+                    self._data = []
+                continue
+            if line.startswith(b"data:"):
+                value = line[5:]
+                if value.startswith(b" "):
+                    value = value[1:]
+                self._data.append(bytes(value))
+            # event:, id:, retry: and comment lines aren't used by the API
+        del self._buffer[:start]
+        return events
+
+    def close(self):
+        """Returns the payload of a trailing event that never got its blank line"""
+        events = self.feed(b"\n")
+        if self._data:
+            events.append(b"\n".join(self._data))
+        self._buffer.clear()
+        self._data = []
+        return events
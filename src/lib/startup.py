@@ -0,0 +1,55 @@
+import json
+import time
+import asyncio
+import logging
+
+from contextlib import contextmanager
+
+
+class Startup:
+    """Times named startup phases, running the slow ones on threads.
+
+    Phases started with run() overlap each other and the event loop, so the
+    welcome screen and earcon don't wait for model loads. report() gives
+    each phase's duration and when it finished relative to launch."""
+
+    def __init__(self) -> None:
+        self._started = time.perf_counter()
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            self.timings[name] = {
+                "seconds": round(finished - started, 4),
+                "finished_at": round(finished - self._started, 4),
+            }
+            logging.debug(f"startup: {name} took {finished - started:.3f}s")
+
+    def mark(self, name):
+        """Records a point in time, such as when the assistant became ready"""
+        elapsed = round(time.perf_counter() - self._started, 4)
+        self.timings[name] = {"seconds": elapsed, "finished_at": elapsed}
+
+    async def run(self, name, function, *args, **kwargs):
+        """Runs function on a worker thread as the named phase"""
+
+        def timed():
+            with self.phase(name):
+                return function(*args, **kwargs)
+
+        return await asyncio.to_thread(timed)
+
+    def report(self):
+        return {
+            "total": round(time.perf_counter() - self._started, 4),
+            "phases": self.timings,
+        }
+
+    def write_report(self, path):
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=2)
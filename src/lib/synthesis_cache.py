@@ -0,0 +1,103 @@
+import os
+import mmap
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+
+
+class SynthesisCache:
+    """Content-addressed cache of synthesized PCM.
+
+    Entries are keyed by the normalized text plus the voice and its
+    synthesis settings. Recent entries stay in an in-memory LRU bounded by
+    max_bytes; with a directory every entry is also written there as raw
+    PCM and memory-mapped back on a later miss, so it survives restarts."""
+
+    def __init__(self, voice, config=None, max_bytes=32 * 2**20, directory=None):
+        # v2: keys stopped folding case, older entries may hold the wrong audio
+        self._prefix = f"v2\0{voice}\0{sorted((config or {}).items())}\0".encode()
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def normalize(text):
+        # Whitespace only: case changes pronunciation ("US" vs "us")
+        return " ".join(text.split())
+
+    def key(self, text):
+        return hashlib.sha256(self._prefix + self.normalize(text).encode()).hexdigest()
+
+    def stats(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def _remember(self, key, pcm):
+        size = len(pcm)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        self._entries[key] = pcm
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def get(self, text):
+        """Returns cached PCM for text as a buffer, or None"""
+        key = self.key(text)
+        with self._lock:
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return pcm
+        if self.directory and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), "rb") as file:
+                    pcm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                logging.debug(f"synthesis cache: {e}")
+            else:
+                with self._lock:
+                    self._remember(key, pcm)
+                    self.disk_hits += 1
+                return pcm
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, pcm):
+        if not pcm:
+            return
+        key = self.key(text)
+        with self._lock:
+            self._remember(key, pcm)
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as file:
+                file.write(pcm)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.debug(f"synthesis cache: {e}")
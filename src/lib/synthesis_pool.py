@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import threading
+
+from collections import OrderedDict, deque
+
+from src.lib.tracing import tracer
+
+
+class _Job:
+    __slots__ = ("session", "text", "emit", "cancelled")
+
+    def __init__(self, session, text, emit) -> None:
+        self.session = session
+        self.text = text
+        self.emit = emit
+        self.cancelled = False
+
+
+class SynthesisPool:
+    """Worker threads sharing one PiperVoice across many sessions.
+
+    Each job is one text segment. Sessions are served round-robin: a worker
+    takes the oldest job of the session at the front of the line, then moves
+    that session to the back, so one long answer can't starve everyone
+    else. ONNX Runtime sessions are safe to run from several threads, so
+    the voice is loaded once; give it one intra-op thread per worker."""
+
+    def __init__(self, voice, workers=2, cache=None) -> None:
+        self.voice = voice
+        self.sample_rate = voice.config.sample_rate
+        self.cache = cache
+        self._queues = OrderedDict()
+        self._running = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def pending(self):
+        with self._cond:
+            return sum(len(jobs) for jobs in self._queues.values())
+
+    def _next_job(self):
+        with self._cond:
+            while not self._queues and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            session, jobs = next(iter(self._queues.items()))
+            job = jobs.popleft()
+            if jobs:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            self._running.setdefault(session, set()).add(job)
+            return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._synthesize(job)
+            except Exception as e:
+                logging.error(f"synthesis pool: Exception: {e}")
+            finally:
+                with self._cond:
+                    running = self._running[job.session]
+                    running.discard(job)
+                    if not running:
+                        del self._running[job.session]
+                job.emit(None)
+
+    def _synthesize(self, job):
+        if job.cancelled:
+            return
+        cached = self.cache.get(job.text) if self.cache is not None else None
+        if cached is not None:
+            job.emit(bytes(cached))
+            return
+        chunks = []
+        with tracer.span("pool.synthesize", chars=len(job.text)):
+            for chunk in self.voice.synthesize_stream_raw(job.text):
+                if job.cancelled:
+                    return
+                chunks.append(chunk)
+                job.emit(chunk)
+        if self.cache is not None:
+            self.cache.put(job.text, b"".join(chunks))
+
+    def submit(self, session, text):
+        """Queues text for session, returns an asyncio.Queue of its PCM.
+
+        The queue gets 16-bit mono chunks at sample_rate, then None once the
+        segment is done. Must be called from the event loop."""
+        loop = asyncio.get_running_loop()
+        out = asyncio.Queue()
+
+        def emit(chunk):
+            try:
+                loop.call_soon_threadsafe(out.put_nowait, chunk)
+            except RuntimeError:
+                # The loop has closed, nobody is listening any more
+                pass
+
+        with self._cond:
+            self._queues.setdefault(session, deque()).append(_Job(session, text, emit))
+            self._cond.notify()
+        return out
+
+    def cancel(self, session):
+        """Drops everything queued for session and stops its running jobs"""
+        with self._cond:
+            jobs = self._queues.pop(session, ())
+            for job in list(jobs) + list(self._running.get(session, ())):
+                job.cancelled = True
+        for job in jobs:
+            job.emit(None)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,104 @@
+import time
+import logging
+import multiprocessing
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Loaded once per worker process by _init_worker
+_voice = None
+
+
+def _init_worker(model_path, config_path, voice_options):
+    global _voice
+    from src.lib.tts import load_voice
+
+    _voice = load_voice(model_path, config_path, **voice_options)
+
+
+def _synthesize(text):
+    """Runs in a worker: synthesizes text into a new shared memory block.
+
+    Returns (block name, PCM bytes, seconds spent) so only a few bytes go
+    back through the pipe; the parent copies the PCM out and unlinks it."""
+    started = time.monotonic()
+    pcm = b"".join(_voice.synthesize_stream_raw(text))
+    if not pcm:
+        return None, 0, time.monotonic() - started
+    block = shared_memory.SharedMemory(create=True, size=len(pcm))
+    block.buf[: len(pcm)] = pcm
+    block.close()
+    return block.name, len(pcm), time.monotonic() - started
+
+
+def _collect(result):
+    name, size, _ = result
+    if name is None:
+        return b""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
+
+
+class ProcessSynthesizer:
+    """Synthesizes segments in parallel, one loaded PiperVoice per process.
+
+    submit() returns a Future of (PCM, seconds spent synthesizing it).
+    Waiting on the futures in submission order is the reorder buffer that
+    keeps playback in order however the workers finish. Every finished
+    segment's shared memory is released as soon as it completes, whether
+    or not anyone still wants it."""
+
+    def __init__(self, model_path, config_path, workers=2, **voice_options):
+        self.workers = workers
+        # One thread per process unless asked otherwise, the processes are
+        # where the parallelism comes from
+        voice_options.setdefault("intra_op_threads", 1)
+        # spawn: forking a process that already runs ONNX Runtime threads is unsafe
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, config_path, voice_options),
+        )
+
+    def submit(self, text):
+        out = Future()
+        task = self._executor.submit(_synthesize, text)
+
+        def done(task):
+            if task.cancelled():
+                out.cancel()
+                return
+            try:
+                result = task.result()
+                # Released even when the segment was discarded while it ran
+                pcm = _collect(result)
+            except Exception as e:
+                logging.error(f"tts worker: Exception: {e}")
+                if out.set_running_or_notify_cancel():
+                    out.set_exception(e)
+                return
+            if out.set_running_or_notify_cancel():
+                out.set_result((pcm, result[2]))
+
+        task.add_done_callback(done)
+        out.task = task
+        return out
+
+    @staticmethod
+    def discard(future):
+        """Gives up on a submitted segment, skipping it if not yet started"""
+        future.task.cancel()
+        future.cancel()
+
+    def warmup(self):
+        """Starts every worker and has it load its voice"""
+        for future in [self.submit("Hello.") for _ in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,221 @@
+import json
+import time
+import bisect
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, Prometheus style, the last bucket is +Inf
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0)
+
+
+class Histogram:
+    def __init__(self, buckets=SECONDS_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, attrs) -> None:
+        self._tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self._tracer.record(self.name, self.start, **self.attrs)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Monotonic-clock spans aggregated into per-name histograms.
+
+    Disabled by default: span() then returns a shared no-op and record()
+    and observe() return immediately, so instrumented code pays for one
+    attribute check. Enabled spans are tagged with the current turn and
+    optionally appended to a JSONL trace file; the histograms can be
+    scraped in Prometheus text format from serve()."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.turn = 0
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._metrics = {}
+        self._file = None
+        self._server = None
+
+    def configure(self, trace_file=None, metrics_port=None, enabled=None):
+        if trace_file:
+            self._file = open(trace_file, "a", encoding="utf-8")
+        if metrics_port:
+            self.serve(metrics_port)
+        self.enabled = bool(trace_file or metrics_port) if enabled is None else enabled
+
+    def new_turn(self):
+        self.turn += 1
+        return self.turn
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs)
+
+    def record(self, name, start, end=None, **attrs):
+        """Records a span measured by hand, end defaults to now"""
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.monotonic()
+        duration = end - start
+        with self._lock:
+            histogram = self._spans.get(name)
+            if histogram is None:
+                histogram = self._spans[name] = Histogram()
+            histogram.observe(duration)
+            if self._file is not None:
+                event = {
+                    "name": name,
+                    "turn": self.turn,
+                    "start": round(start, 6),
+                    "duration": round(duration, 6),
+                }
+                if attrs:
+                    event.update(attrs)
+                self._file.write(json.dumps(event) + "\n")
+
+    def observe(self, metric, value, buckets=SECONDS_BUCKETS):
+        """Adds a value that isn't a duration, e.g. a real-time factor"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._metrics.get(metric)
+            if histogram is None:
+                histogram = self._metrics[metric] = Histogram(buckets)
+            histogram.observe(value)
+
+    def summary(self):
+        """p50/p90/p99 bucket bounds and counts for every span, in seconds"""
+        with self._lock:
+            return {
+                name: {
+                    "count": h.count,
+                    "mean": h.sum / h.count,
+                    "p50": h.percentile(50),
+                    "p90": h.percentile(90),
+                    "p99": h.percentile(99),
+                }
+                for name, h in self._spans.items()
+            }
+
+    @staticmethod
+    def _histogram_lines(metric, labels, histogram):
+        lines = []
+        cumulative = 0
+        bounds = [str(b) for b in histogram.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        labels = labels.rstrip(",")
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{metric}_sum{suffix} {histogram.sum}")
+        lines.append(f"{metric}_count{suffix} {histogram.count}")
+        return lines
+
+    def prometheus(self):
+        lines = [
+            "# HELP assistant_span_seconds Duration of instrumented spans",
+            "# TYPE assistant_span_seconds histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._spans.items()):
+                lines += self._histogram_lines(
+                    "assistant_span_seconds", f'span="{name}",', histogram
+                )
+            for metric, histogram in sorted(self._metrics.items()):
+                lines.append(f"# TYPE assistant_{metric} histogram")
+                lines += self._histogram_lines(f"assistant_{metric}", "", histogram)
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serves prometheus() at http://host:port/metrics on a daemon thread"""
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logging.error(f"tracing: Exception: {e}")
+            return
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.enabled = False
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+tracer = Tracer()
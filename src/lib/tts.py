@@ -1,11 +1,220 @@
 import os
-import requests
-import sounddevice as sd
+import json
+import time
+import queue
+import threading
+import logging
+import onnxruntime
+
+from concurrent.futures import Future
+from functools import partial
 
 from piper import PiperVoice
+from piper.config import PiperConfig
+from src.lib.assets import Asset, AssetManager
+from src.lib.output import AudioOutput
+from src.lib.synthesis_cache import SynthesisCache
+from src.lib.synthesis_workers import ProcessSynthesizer
+from src.lib.tracing import tracer, RATIO_BUCKETS
 
 _DIR = os.path.dirname(os.path.abspath(__file__))
 
+_GRAPH_OPTIMIZATION = {
+    "none": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def load_config(config_path):
+    with open(config_path, "r", encoding="utf-8") as config_file:
+        return PiperConfig.from_dict(json.load(config_file))
+
+
+def _is_current(optimized_model_path, model_path):
+    return os.path.exists(optimized_model_path) and os.path.getmtime(
+        optimized_model_path
+    ) >= os.path.getmtime(model_path)
+
+
+def load_voice(
+    model_path,
+    config_path,
+    intra_op_threads=0,
+    inter_op_threads=0,
+    graph_optimization="all",
+    optimized_model_path=None,
+):
+    """PiperVoice.load with tunable ONNX Runtime session options.
+
+    Thread counts of 0 leave the choice to ONNX Runtime. With
+    optimized_model_path the optimized graph is saved on first load and
+    loaded as-is afterwards, skipping graph optimization on startup. An
+    optimized model that fails to load is deleted and made again."""
+    config = load_config(config_path)
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    if optimized_model_path and _is_current(optimized_model_path, model_path):
+        options.graph_optimization_level = _GRAPH_OPTIMIZATION["none"]
+        try:
+            return PiperVoice(
+                session=_load_session(optimized_model_path, options), config=config
+            )
+        except Exception as e:
+            logging.error(f"tts optimized model: Exception: {e}")
+            try:
+                os.remove(optimized_model_path)
+            except OSError:
+                # Another worker got to it first
+                pass
+
+    options.graph_optimization_level = _GRAPH_OPTIMIZATION[graph_optimization]
+    if optimized_model_path:
+        # ORT writes the file as it goes; a temporary name keeps an
+        # interrupted first load from leaving a truncated "current" model
+        root, extension = os.path.splitext(optimized_model_path)
+        partial_path = f"{root}.{os.getpid()}.part{extension}"
+        options.optimized_model_filepath = partial_path
+    session = _load_session(model_path, options)
+    if optimized_model_path:
+        try:
+            os.replace(partial_path, optimized_model_path)
+        except OSError as e:
+            logging.debug(f"tts optimized model: Exception: {e}")
+    return PiperVoice(session=session, config=config)
+
+
+def _load_session(model_path, options):
+    return onnxruntime.InferenceSession(
+        str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+    )
+
+
+class SpeechPipeline:
+    """Synthesizes queued segments on one thread while another plays them back.
+
+    With prepare, put() hands each text to prepare right away and queues
+    what it returns for synthesize instead, so work can start before the
+    segments ahead of it are done; discard is called for anything dropped."""
+
+    def __init__(
+        self, synthesize, sample_rate=22050, max_pending=8, prepare=None, discard=None
+    ) -> None:
+        self._synthesize = synthesize
+        self._prepare = prepare
+        self._discard = discard
+        self._sample_rate = sample_rate
+        self._segments = queue.Queue()
+        self._pcm = queue.Queue(maxsize=max_pending)
+        self._output = AudioOutput.shared()
+        # Bumped by cancel(), anything queued under an older value is dropped
+        self._generation = 0
+        self._playback_start = 0.0
+        self._synth_thread = threading.Thread(target=self._synth_loop, daemon=True)
+        self._play_thread = threading.Thread(target=self._play_loop, daemon=True)
+        self._synth_thread.start()
+        self._play_thread.start()
+
+    def _synth_loop(self):
+        while True:
+            segment = self._segments.get()
+            try:
+                if segment is None:
+                    self._pcm.put(None)
+                    return
+                generation, text, on_start = segment
+                if generation != self._generation:
+                    if self._discard is not None:
+                        self._discard(text)
+                    continue
+                if on_start is not None:
+                    # Registered by the playback thread when it reaches this
+                    # point, called once the audio before it has been played
+                    self._pcm.put((generation, partial(self._output.mark, on_start)))
+                if tracer.enabled:
+                    self._pcm.put((generation, self._playback_started))
+                for chunk in self._synthesize(text):
+                    if generation != self._generation:
+                        break
+                    self._pcm.put((generation, chunk))
+                if tracer.enabled:
+                    self._pcm.put((generation, self._playback_ended))
+            except Exception as e:
+                logging.error(f"tts synth: Exception: {e}")
+            finally:
+                self._segments.task_done()
+
+    def _play_loop(self):
+        while True:
+            item = self._pcm.get()
+            try:
+                if item is None:
+                    return
+                generation, chunk = item
+                if generation != self._generation:
+                    continue
+                if callable(chunk):
+                    chunk()
+                    continue
+                self._output.write(memoryview(chunk), self._sample_rate)
+            except Exception as e:
+                logging.error(f"tts play: Exception: {e}")
+            finally:
+                self._pcm.task_done()
+
+    def _heard_at(self):
+        # Audio written now is heard once everything already buffered has played
+        return time.monotonic() + self._output.queue_depth / self._output.sample_rate
+
+    def _playback_started(self):
+        self._playback_start = self._heard_at()
+
+    def _playback_ended(self):
+        tracer.record("tts.playback", self._playback_start, self._heard_at())
+
+    def put(self, text, on_start=None):
+        if self._prepare is not None:
+            text = self._prepare(text)
+        self._segments.put((self._generation, text, on_start))
+
+    @staticmethod
+    def _drain(q, discard=None):
+        while True:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                return
+            if item is None:
+                # Leave close() sentinels for the threads
+                q.put_nowait(None)
+            elif discard is not None:
+                discard(item[1])
+            q.task_done()
+            if item is None:
+                return
+
+    def cancel(self):
+        """Drops queued segments and audio and stops playback (barge-in)"""
+        self._generation += 1
+        self._drain(self._segments, self._discard)
+        self._drain(self._pcm)
+        self._output.cancel()
+
+    def join(self):
+        # Every segment is synthesized before its last chunk is queued, so once
+        # the segment queue is drained the pcm queue holds all that is left.
+        self._segments.join()
+        self._pcm.join()
+        self._output.flush()
+
+    def close(self):
+        self._segments.put(None)
+        self._synth_thread.join()
+        self._play_thread.join()
+
 
 class TTS:
     class _PATHS:
@@ -16,44 +225,190 @@ class TTS:
         AMY_MODEL = "https://huggingface.co/rhasspy/piper-voices/resolve/v1.0.0/en/en_US/amy/medium/en_US-amy-medium.onnx"
         AMY_CONFIG = "https://huggingface.co/rhasspy/piper-voices/resolve/v1.0.0/en/en_US/amy/medium/en_US-amy-medium.onnx.json"
 
+    @classmethod
+    def _assets(cls):
+        # No pinned digests: Hugging Face publishes the model's SHA-256 as
+        # X-Linked-Etag and AssetManager checks against that
+        return [
+            Asset(
+                cls._URLS.AMY_MODEL,
+                os.path.normpath(os.path.join(cls._PATHS.AMY, "en_US-amy-medium.onnx")),
+            ),
+            Asset(
+                cls._URLS.AMY_CONFIG,
+                os.path.normpath(os.path.join(cls._PATHS.AMY, "config.json")),
+            ),
+        ]
+
     def _ensure_files(self):
-        if not os.path.exists(self._PATHS.AMY):
-            os.makedirs(self._PATHS.AMY)
-        if not os.path.exists(
-            os.path.normpath(os.path.join(self._PATHS.AMY, "en_US-amy-medium.onnx"))
-        ) or not os.path.exists(
-            os.path.normpath(os.path.join(self._PATHS.AMY, "config.json"))
-        ):
-            self.download_and_unzip()
-
-    def __init__(self):
+        self.download_and_unzip()
+
+    def __init__(
+        self,
+        cache_bytes=32 * 2**20,
+        cache_dir=None,
+        intra_op_threads=0,
+        inter_op_threads=0,
+        graph_optimization="all",
+        save_optimized_model=True,
+        warmup=True,
+        processes=0,
+    ):
         self._ensure_files()
         model_path = os.path.normpath(
             os.path.join(self._PATHS.AMY, "en_US-amy-medium.onnx")
         )
         config_path = os.path.normpath(os.path.join(self._PATHS.AMY, "config.json"))
+        optimized_path = os.path.normpath(
+            os.path.join(
+                self._PATHS.AMY, f"en_US-amy-medium.{graph_optimization}.ort.onnx"
+            )
+        )
+
+        if not save_optimized_model:
+            optimized_path = None
+
+        self.tts = None
+        if not processes:
+            self.tts = load_voice(
+                model_path,
+                config_path,
+                intra_op_threads=intra_op_threads,
+                inter_op_threads=inter_op_threads,
+                graph_optimization=graph_optimization,
+                optimized_model_path=optimized_path,
+            )
+        elif optimized_path and not _is_current(optimized_path, model_path):
+            # Saves the optimized model once, so the workers only read it,
+            # and lets the voice go: only the workers synthesize
+            load_voice(
+                model_path,
+                config_path,
+                graph_optimization=graph_optimization,
+                optimized_model_path=optimized_path,
+            )
+        self.config = config = self.tts.config if self.tts else load_config(config_path)
+        self.cache = SynthesisCache(
+            os.path.basename(model_path),
+            {
+                "sample_rate": config.sample_rate,
+                "length_scale": config.length_scale,
+                "noise_scale": config.noise_scale,
+                "noise_w": config.noise_w,
+            },
+            max_bytes=cache_bytes,
+            directory=cache_dir,
+        )
+        self.workers = None
+        if processes:
+            self.workers = ProcessSynthesizer(
+                model_path,
+                config_path,
+                workers=processes,
+                graph_optimization=graph_optimization,
+                optimized_model_path=optimized_path,
+            )
+            self.pipeline = SpeechPipeline(
+                self._synthesize_prepared,
+                sample_rate=config.sample_rate,
+                prepare=self._prepare,
+                discard=self._discard,
+            )
+        else:
+            self.pipeline = SpeechPipeline(
+                self.synthesize, sample_rate=config.sample_rate
+            )
+        if warmup:
+            threading.Thread(target=self.warmup, daemon=True).start()
 
-        self.tts = PiperVoice.load(model_path, config_path, use_cuda=False)
+    def warmup(self):
+        """Runs one throwaway synthesis so the first reply skips lazy init"""
+        try:
+            if self.workers is not None:
+                self.workers.warmup()
+                return
+            for _ in self.tts.synthesize_stream_raw("Hello."):
+                pass
+        except Exception as e:
+            logging.debug(f"tts warmup: Exception: {e}")
 
     def download_and_unzip(self):
-        response = requests.get(self._URLS.AMY_MODEL, stream=True)
-        with open(
-            os.path.normpath(os.path.join(self._PATHS.AMY, "en_US-amy-medium.onnx")),
-            "wb",
-        ) as file:
-            for chunk in response.iter_content(chunk_size=128):
-                file.write(chunk)
-        response = requests.get(self._URLS.AMY_CONFIG, stream=True)
-        with open(
-            os.path.normpath(os.path.join(self._PATHS.AMY, "config.json")), "wb"
-        ) as file:
-            for chunk in response.iter_content(chunk_size=128):
-                file.write(chunk)
+        AssetManager().ensure(self._assets())
+
+    def synthesize(self, text):
+        cached = self.cache.get(text)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        # Time spent in Piper only, not while the consumer holds a chunk
+        elapsed = 0.0
+        started = time.monotonic()
+        for chunk in self.tts.synthesize_stream_raw(text):
+            elapsed += time.monotonic() - started
+            chunks.append(chunk)
+            yield chunk
+            started = time.monotonic()
+        elapsed += time.monotonic() - started
+        # Only reached when the whole text was synthesized, not on barge-in
+        pcm = b"".join(chunks)
+        self.cache.put(text, pcm)
+        self._trace_synthesis(text, elapsed, len(pcm))
+
+    def _prepare(self, text):
+        """Sends text to a worker process as soon as it is queued"""
+        cached = self.cache.get(text)
+        return text, cached if cached is not None else self.workers.submit(text)
+
+    def _synthesize_prepared(self, job):
+        text, pcm = job
+        if isinstance(pcm, Future):
+            # Segments are taken in order, so this waits only on the oldest
+            pcm, elapsed = pcm.result()
+            self.cache.put(text, pcm)
+            self._trace_synthesis(text, elapsed, len(pcm))
+        if pcm:
+            yield pcm
+
+    def _discard(self, job):
+        if isinstance(job[1], Future):
+            self.workers.discard(job[1])
+
+    def _trace_synthesis(self, text, elapsed, pcm_bytes):
+        if not tracer.enabled or not pcm_bytes:
+            return
+        audio_seconds = pcm_bytes / 2 / self.config.sample_rate
+        rtf = elapsed / audio_seconds
+        now = time.monotonic()
+        tracer.record(
+            "tts.synthesize",
+            now - elapsed,
+            now,
+            chars=len(text),
+            audio_seconds=round(audio_seconds, 3),
+            rtf=round(rtf, 3),
+        )
+        tracer.observe("tts_real_time_factor", rtf, RATIO_BUCKETS)
+
+    def speak(self, text, on_start=None):
+        """Queues text for synthesis and playback without waiting for it.
+
+        on_start is called from the audio thread once the text starts playing."""
+        self.pipeline.put(text, on_start)
+
+    def wait(self):
+        """Blocks until everything queued with speak() has been played"""
+        self.pipeline.join()
+
+    def cancel(self):
+        self.pipeline.cancel()
 
     def text_to_speech(self, text):
-        stream = sd.RawOutputStream(samplerate=22050, dtype="int16", channels=1)
-        stream.start()
-        for bytes in self.tts.synthesize_stream_raw(text):
-            stream.write(bytes)
-        stream.close()
+        self.speak(text)
+        self.wait()
         return
+
+    def close(self):
+        self.pipeline.close()
+        if self.workers is not None:
+            self.workers.close()
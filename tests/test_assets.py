@@ -0,0 +1,152 @@
+import os
+import hashlib
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.lib.assets import Asset, AssetError, AssetManager
+
+BODY = bytes(range(256)) * 64
+DIGEST = hashlib.sha256(BODY).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves BODY with Range support and the digest as X-Linked-Etag"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond()
+
+    def _respond(self, head=False):
+        server = self.server
+        server.ranges.append(self.headers.get("Range"))
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"][len("bytes=") : -1])
+            if start >= len(BODY):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(BODY)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        body = BODY[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"
+            )
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Linked-Etag", f'"{server.etag}"')
+        self.end_headers()
+        if head:
+            return
+        if server.cut_at is not None:
+            # Drops the connection part way through the body
+            self.wfile.write(body[: server.cut_at])
+            server.cut_at = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.ranges = []
+    server.cut_at = None
+    server.etag = DIGEST
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def asset(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}/voice.onnx"
+    return Asset(url, str(tmp_path / "models" / "voice.onnx"))
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def write_part(asset, data):
+    os.makedirs(os.path.dirname(asset.path))
+    with open(f"{asset.path}.part", "wb") as file:
+        file.write(data)
+
+
+def test_download(server, asset):
+    assert AssetManager().ensure([asset]) == [asset.path]
+    assert read(asset.path) == BODY
+    # Complete files aren't downloaded again
+    AssetManager().ensure([asset])
+    assert server.ranges == [None]
+
+
+def test_truncated_download_resumes(server, asset):
+    server.cut_at = 5000
+    assets = AssetManager(chunk_size=1024)
+    with pytest.raises((AssetError, requests.RequestException)):
+        assets.ensure([asset])
+    assert not os.path.exists(asset.path)
+    received = os.path.getsize(f"{asset.path}.part")
+    assert 0 < received <= 5000
+
+    assets.ensure([asset])
+    assert server.ranges == [None, f"bytes={received}-"]
+    assert read(asset.path) == BODY
+    assert not os.path.exists(f"{asset.path}.part")
+
+
+def test_complete_part_file(server, asset):
+    write_part(asset, BODY)
+    AssetManager().ensure([asset])
+    assert server.ranges == [f"bytes={len(BODY)}-"]
+    assert read(asset.path) == BODY
+
+
+def test_oversized_part_file_starts_over(server, asset):
+    write_part(asset, BODY + b"stale")
+    AssetManager().ensure([asset])
+    assert server.ranges == [f"bytes={len(BODY) + 5}-", None]
+    assert read(asset.path) == BODY
+
+
+def test_published_checksum_mismatch(server, asset):
+    server.etag = hashlib.sha256(b"something else").hexdigest()
+    with pytest.raises(AssetError):
+        AssetManager().ensure([asset])
+    assert not os.path.exists(asset.path)
+    assert not os.path.exists(f"{asset.path}.part")
+
+
+def test_pinned_checksum_mismatch(asset):
+    asset = asset._replace(sha256=hashlib.sha256(b"other").hexdigest())
+    with pytest.raises(AssetError):
+        AssetManager().ensure([asset])
+    assert not os.path.exists(asset.path)
+
+
+def test_pinned_checksum_takes_precedence(server, asset):
+    server.etag = "not a digest"
+    AssetManager().ensure([asset._replace(sha256=DIGEST)])
+    assert read(asset.path) == BODY
+
+
+def test_file_without_sidecar_is_checked(server, asset):
+    os.makedirs(os.path.dirname(asset.path))
+    with open(asset.path, "wb") as file:
+        file.write(BODY[:-1] + b"\0")
+    AssetManager().ensure([asset])
+    assert read(asset.path) == BODY
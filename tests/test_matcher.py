@@ -0,0 +1,68 @@
+import pytest
+
+from src.lib.commands import (
+    QUIT_PHRASES,
+    SIMILARITY_THRESHOLD,
+    SLEEP_GRAMMAR,
+    WAKE_PHRASES,
+)
+from src.lib.matcher import CommandMatcher, normalize
+
+# ASR-style transcripts and the command each should trigger, if any
+CORPUS = [
+    ("stop", "quit"),
+    ("quit", "quit"),
+    ("exit", "quit"),
+    ("shut down", "quit"),
+    ("shutdown", "quit"),
+    ("okay g p t", "wake"),
+    ("ok g p t", "wake"),
+    ("hey g p t", "wake"),
+    ("chat g p t", "wake"),
+    ("chat gpt", "wake"),
+    ("hey gpt", "wake"),
+    ("Hey, GPT!", "wake"),
+    ("what is the tallest stop sign", None),
+    ("please tell me about post offices", None),
+    ("stop the music", None),
+    ("tops", None),
+    ("spots", None),
+    ("pots and pans", None),
+    ("the exit interview", None),
+    ("what's the weather", None),
+    ("huh", None),
+    ("quite", None),
+    ("hey", None),
+    ("the", None),
+]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    matcher = CommandMatcher(SIMILARITY_THRESHOLD)
+    matcher.add("quit", QUIT_PHRASES)
+    matcher.add("wake", WAKE_PHRASES)
+    return matcher
+
+
+@pytest.mark.parametrize("text, command", CORPUS)
+def test_corpus(matcher, text, command):
+    match = matcher.match(text)
+    assert (match.command if match else None) == command
+
+
+@pytest.mark.parametrize("text", SLEEP_GRAMMAR)
+def test_everything_the_sleep_grammar_hears_is_a_command(matcher, text):
+    assert matcher.match(text) is not None
+
+
+def test_normalize_joins_spelled_letters():
+    assert normalize("Okay, G P T.") == "okay gpt"
+    assert normalize("a b test") == "ab test"
+
+
+def test_per_phrase_threshold(matcher):
+    loose = CommandMatcher(SIMILARITY_THRESHOLD)
+    loose.add("quit", ["shut down"], threshold=0.6)
+    assert loose.match("shut down now").command == "quit"
+    assert matcher.match("shut down now") is None
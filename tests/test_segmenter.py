@@ -0,0 +1,84 @@
+import random
+
+from src.lib.segmenter import Segmenter
+
+
+def segment(text, chunk_size=None, **kwargs):
+    """Feeds text in chunks the way a completion stream arrives"""
+    segmenter = Segmenter(**kwargs)
+    rng = random.Random(0)
+    segments = []
+    i = 0
+    while i < len(text):
+        size = chunk_size or rng.randint(1, 8)
+        segments += segmenter.feed(text[i : i + size])
+        i += size
+    return segments + segmenter.flush()
+
+
+def test_joined_segments_equal_input():
+    text = (
+        "Sure, here is the plan. First we preheat the oven to 220 degrees, "
+        "which takes about fifteen minutes. Then the dough goes in for half an "
+        "hour; after that it needs to cool. Enjoy!\n1. Mix\n2. Bake"
+    )
+    for chunk_size in (None, 1, 3, 50):
+        assert "".join(segment(text, chunk_size)) == text
+
+
+def test_short_first_clause():
+    text = "In short, yes it does, and here is why, which matters a lot for you."
+    segments = segment(text)
+    # The first clause with three words goes out alone, later clauses don't
+    assert segments == ["In short, yes it does,", text[len("In short, yes it does,") :]]
+
+
+def test_first_segment_waits_for_min_words():
+    segments = segment("Yes, that is right, it works.")
+    assert segments[0] == "Yes, that is right,"
+
+
+def test_abbreviations_do_not_end_sentences():
+    text = (
+        "I asked Dr. Smith and Mrs. Jones about it yesterday. "
+        "They met at 5 p.m. near the U.S. border with friends from work today. "
+        "Nobody could agree on anything at all that evening."
+    )
+    segments = segment(text, min_words=3)
+    assert segments[0].startswith("I asked Dr. Smith and Mrs. Jones")
+    assert any("p.m. near the U.S. border" in s for s in segments)
+    assert "".join(segments) == text
+
+
+def test_initials_do_not_end_sentences():
+    segments = segment("The book was written by J. R. R. Tolkien in England.")
+    assert "J. R. R. Tolkien" in segments[0]
+
+
+def test_numbers_are_not_split():
+    text = "It costs 3.5 dollars per unit, so 1,000 units cost 3,500 dollars."
+    segments = segment(text, chunk_size=1, first_min_words=1)
+    assert not any(s.endswith("3.") or s.endswith("1,") for s in segments)
+    assert any("3.5" in s for s in segments)
+    assert any("1,000" in s for s in segments)
+    assert "".join(segments) == text
+
+
+def test_oregon_is_not_split_on_or():
+    text = "Portland is the largest city in Oregon and it sits on a river."
+    assert segment(text) == [text]
+
+
+def test_list_numbers_only_at_line_start():
+    segments = segment("Here are the steps:\n1. Mix the flour\n2. Bake it.")
+    assert not any(s.rstrip().endswith(("1.", "2.")) for s in segments)
+
+
+def test_number_ends_sentence_mid_line():
+    text = (
+        "He was born in a small town near the coast in 1990. "
+        "Then he moved to the city to study music and art."
+    )
+    segments = segment(text, min_words=5)
+    assert segments[0].endswith("in 1990.")
+    assert segments[1] == " Then he moved to the city to study music and art."
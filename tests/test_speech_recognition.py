@@ -0,0 +1,127 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("vosk")
+
+from src.lib.speech_recognition import GatedDecoder
+
+RATE = 16000
+BLOCK = RATE // 10
+
+
+def tone(rms, blocks=1):
+    """blocks of a 200 Hz sine, speech-like to the VAD at this level"""
+    t = np.arange(BLOCK * blocks) / RATE
+    return (np.sin(2 * np.pi * 200 * t) * rms * np.sqrt(2)).astype(np.int16).tobytes()
+
+
+def silence(blocks=1):
+    return bytes(BLOCK * 2 * blocks)
+
+
+class FakeRecognizer:
+    """Hears the next scripted word in every block louder than min_rms"""
+
+    def __init__(self, words, min_rms=1000) -> None:
+        self.script = list(words)
+        self.min_rms = min_rms
+        self.words = []
+
+    def AcceptWaveform(self, data):
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if self.script and np.sqrt(np.mean(samples * samples)) >= self.min_rms:
+            self.words.append(self.script.pop(0))
+        return False
+
+    def PartialResult(self):
+        return json.dumps({"partial": " ".join(self.words)})
+
+    def FinalResult(self):
+        text, self.words = " ".join(self.words), []
+        return json.dumps({"text": text})
+
+    def Reset(self):
+        self.words = []
+
+
+def feed(decoder, *chunks):
+    texts = []
+    for chunk in chunks:
+        for offset in range(0, len(chunk), BLOCK * 2):
+            texts += decoder.process(chunk[offset : offset + BLOCK * 2])
+    return texts
+
+
+def test_gate_close_flushes_the_utterance():
+    starts = []
+    decoder = GatedDecoder(
+        FakeRecognizer(["hello", "[unk]", "world"]),
+        on_speech_start=lambda: starts.append(1),
+    )
+    assert feed(decoder, silence(5), tone(3000, 3)) == []
+    assert starts == [1]
+    assert feed(decoder, silence(10)) == ["hello world"]
+    assert not decoder.capturing and not decoder.vad.active
+
+
+def test_noise_words_are_dropped():
+    decoder = GatedDecoder(FakeRecognizer(["huh"]))
+    assert feed(decoder, tone(3000, 2), silence(10)) == []
+
+
+def test_endpointer_finalizes_inside_the_hangover():
+    decoder = GatedDecoder(FakeRecognizer(["hello", "there"]), endpoint_ms=300)
+    assert feed(decoder, tone(3000, 2), silence(4)) == ["hello there"]
+    assert decoder.vad.active
+    # The gate closing afterwards doesn't finalize it a second time
+    assert feed(decoder, silence(10)) == []
+
+
+def test_stable_partial_hook():
+    partials = []
+    decoder = GatedDecoder(
+        FakeRecognizer(["what", "time"]),
+        on_stable_partial=partials.append,
+        stable_ms=300,
+    )
+    feed(decoder, tone(3000, 2), silence(4))
+    assert partials == ["what time"]
+
+
+def endpointed(words, starts):
+    decoder = GatedDecoder(
+        FakeRecognizer(words, min_rms=400),
+        endpoint_ms=300,
+        on_speech_start=lambda: starts.append(1),
+    )
+    assert feed(decoder, tone(3000, 2), silence(4)) == [" ".join(words[:2])]
+    # Finalized by the endpointer while the hangover still holds the gate open
+    assert decoder.vad.active
+    return decoder
+
+
+def test_echo_in_the_hangover_is_not_decoded():
+    starts = []
+    decoder = endpointed(["what", "time", "it", "is", "four"], starts)
+    decoder.guard_echo(True)
+    # Quieter than the guarded threshold but louder than the usual one
+    assert feed(decoder, tone(500, 20), silence(10)) == []
+    assert starts == [1]
+
+
+def test_loud_echo_has_to_open_the_gate_again():
+    starts = []
+    decoder = endpointed(["what", "time", "it", "is", "four"], starts)
+    decoder.guard_echo(True)
+    feed(decoder, tone(3000, 20), silence(10))
+    # Only reaches the transcript after a barge-in the assistant can act on
+    assert starts == [1, 1]
+
+
+def test_unguarded_echo_in_the_hangover_is_decoded():
+    starts = []
+    decoder = endpointed(["what", "time", "it", "is"], starts)
+    assert feed(decoder, tone(500, 20), silence(10)) == ["it is"]
+    assert starts == [1]
@@ -0,0 +1,15 @@
+from src.lib.synthesis_cache import SynthesisCache
+
+
+def test_whitespace_is_normalized_but_case_is_not(tmp_path):
+    cache = SynthesisCache("voice", {"sample_rate": 22050}, directory=str(tmp_path))
+    cache.put("The  US\n", b"\x01\x00" * 10)
+    assert bytes(cache.get(" The US")) == b"\x01\x00" * 10
+    assert cache.get("The us") is None
+
+
+def test_entries_survive_a_restart(tmp_path):
+    SynthesisCache("voice", directory=str(tmp_path)).put("Hello.", b"\x02\x00" * 4)
+    cache = SynthesisCache("voice", directory=str(tmp_path))
+    assert bytes(cache.get("Hello.")) == b"\x02\x00" * 4
+    assert cache.disk_hits == 1